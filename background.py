@@ -0,0 +1,119 @@
+"""Welcome-screen background, scaled once per size instead of on every paint.
+
+A style-sheet `border-image ... stretch` has Qt scale the full image each
+time the window paints. Backdrop decodes the image once, scales it
+smoothly to the widget's size in device pixels and keeps that QPixmap, so
+a paint is a plain copy. While the window is being resized the cached
+pixmap is stretched cheaply, and the smooth rescale runs once the size has
+settled for RESCALE_DEBOUNCE_MS.
+
+Low-resolution kiosks can be shipped a pre-downsampled copy of the asset,
+named `<name>@<width>.<ext>` next to it; the smallest copy that still
+covers the screen is the one decoded.
+
+    python background.py assets/b_g.png --width 1366    # writes assets/b_g@1366.png
+"""
+import argparse
+import glob
+import os
+import sys
+
+from PyQt5.QtCore import QSize, Qt, QTimer
+from PyQt5.QtGui import QImage, QImageReader, QPainter, QPixmap
+from PyQt5.QtWidgets import QWidget
+
+# quiet time after the last resize before the background is rescaled smoothly
+RESCALE_DEBOUNCE_MS = 150
+
+# decoded images by path, shared by every Backdrop in the process
+_decoded = {}
+
+
+def variant_path(path, width):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}@{width}{ext}"
+
+
+def pick_variant(path, size):
+    """The smallest of path and its @width copies that covers size (device pixels), else the largest.
+
+    Only image headers are read here, nothing is decoded.
+    """
+    stem, ext = os.path.splitext(path)
+    candidates = []
+    for p in [path] + glob.glob(glob.escape(stem) + "@*" + ext):
+        s = QImageReader(p).size()
+        if s.isValid():
+            candidates.append((s.width() * s.height(), s, p))
+    candidates.sort(key=lambda c: c[0])
+    for _, s, p in candidates:
+        if s.width() >= size.width() and s.height() >= size.height():
+            return p
+    return candidates[-1][2] if candidates else path
+
+
+def _decode(path):
+    image = _decoded.get(path)
+    if image is None:
+        image = _decoded[path] = QImage(path)
+    return image
+
+
+class Backdrop(QWidget):
+    """A widget that paints `path` stretched over itself from a cached, pre-scaled pixmap."""
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self._pixmap = None
+        self._rescale_timer = QTimer(self)
+        self._rescale_timer.setSingleShot(True)
+        self._rescale_timer.timeout.connect(lambda: self.prescale(self.size()))
+
+    def prescale(self, size):
+        """Scale the background for `size` (logical pixels) now; a no-op if the cache already fits."""
+        dpr = self.devicePixelRatioF()
+        target = QSize(round(size.width() * dpr), round(size.height() * dpr))
+        if target.isEmpty() or (self._pixmap is not None and self._pixmap.size() == target):
+            return
+        image = _decode(pick_variant(self.path, target))
+        if image.isNull():
+            return
+        pixmap = QPixmap.fromImage(image.scaled(target, Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        pixmap.setDevicePixelRatio(dpr)
+        self._pixmap = pixmap
+        self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self._pixmap is None:
+            self.prescale(event.size())
+        else:
+            self._rescale_timer.start(RESCALE_DEBOUNCE_MS)
+
+    def paintEvent(self, event):
+        if self._pixmap is None:
+            return
+        painter = QPainter(self)
+        # a straight copy when the cache fits; mid-resize, a fast stretch until the rescale lands
+        painter.drawPixmap(self.rect(), self._pixmap)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a pre-downsampled copy of a background image.")
+    parser.add_argument("path", help="the full-size image, e.g. assets/b_g.png")
+    parser.add_argument("--width", type=int, required=True, help="width of the copy in pixels; the height keeps the aspect ratio")
+    args = parser.parse_args(argv)
+    image = QImage(args.path)
+    if image.isNull():
+        print(f"Cannot read {args.path}.")
+        return 1
+    height = round(image.height() * args.width / image.width())
+    out = variant_path(args.path, args.width)
+    image.scaled(args.width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation).save(out)
+    print(f"Wrote {out} ({args.width}x{height}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Throughput of concurrent checkout/return against one database file.
+
+Each writer process plays a circulation desk: it picks a book from a small
+shared set and checks it out, as fast as it can. A desk keeps its last few
+loans open and returns the oldest one once it holds more, so a good part of
+the shared copies is out at any moment. Desks compete for the same copies,
+and many checkouts lose the compare-and-set and raise BookUnavailable. At the end the script checks that no copy was ever lent
+twice: every book has at most one open loan, and its status agrees.
+
+    python benchmarks/bench_checkout.py --writers 4 --seconds 5
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import setup  # noqa: E402
+from db import BookUnavailable, ConnectionPool, LoanRepo, ensure_indexes, is_busy, migrate  # noqa: E402
+
+
+def _build(path, n_books, wal):
+    conn = sqlite3.connect(path)
+    if wal:
+        conn.execute("PRAGMA journal_mode=WAL")
+    setup.ensure_tables(conn)
+    conn.executemany(
+        "INSERT INTO book (title, author, status, rack_column_row, year, isbn) VALUES (?,?,?,?,?,?)",
+        [(f"Title {i}", "Author", 'available', '', 2000, 1000 + i) for i in range(n_books)],
+    )
+    conn.commit()
+    migrate(conn)
+    ensure_indexes(conn)
+    book_ids = [r[0] for r in conn.execute("SELECT id FROM book")]
+    conn.close()
+    return book_ids
+
+
+def _desk(path, desk, book_ids, seconds, hold, wal, results):
+    rng = random.Random(desk)
+    loans = LoanRepo(ConnectionPool(path, journal_mode='WAL' if wal else 'DELETE'))
+    held = collections.deque()
+    done = conflicts = busy = 0
+
+    def give_back():
+        # return the oldest loan so the copy goes back into play
+        nonlocal busy
+        while True:
+            try:
+                loans.return_loan(held[0], "2024-01-10T00:00:00")
+                break
+            except sqlite3.OperationalError as e:
+                if not is_busy(e):
+                    raise
+                busy += 1
+        held.popleft()
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        book_id = rng.choice(book_ids)
+        try:
+            held.append(loans.checkout(desk, f"desk{desk}", book_id, "2024-01-01T00:00:00", "2024-01-15T00:00:00", max_loans=10**9))
+        except BookUnavailable:
+            conflicts += 1
+            continue
+        except sqlite3.OperationalError as e:
+            if not is_busy(e):
+                raise
+            busy += 1
+            continue
+        if len(held) > hold:
+            give_back()
+        done += 1
+    while held:
+        give_back()
+    results.put((done, conflicts, busy))
+
+
+def _check(path):
+    """Problems found: books with several open loans, or a status that disagrees with its loans."""
+    conn = sqlite3.connect(path)
+    problems = conn.execute(
+        """
+        SELECT b.id, b.status, COUNT(l.loan_id) AS open_loans FROM book AS b
+        LEFT JOIN loans AS l ON l.book_pk = b.id AND l.returned_at IS NULL
+        GROUP BY b.id
+        HAVING open_loans > 1 OR (open_loans = 1) != (b.status = 'checked out')
+        """
+    ).fetchall()
+    conn.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--writers", type=int, default=4, help="concurrent desk processes")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long each desk runs")
+    parser.add_argument("--books", type=int, default=20, help="copies the desks compete for")
+    parser.add_argument("--hold", type=int, default=3, help="loans each desk keeps open before returning the oldest")
+    parser.add_argument("--wal", action="store_true", help="use WAL journal mode")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        book_ids = _build(path, args.books, args.wal)
+        results = multiprocessing.Queue()
+        desks = [
+            multiprocessing.Process(target=_desk, args=(path, desk, book_ids, args.seconds, args.hold, args.wal, results))
+            for desk in range(1, args.writers + 1)
+        ]
+        for p in desks:
+            p.start()
+        totals = [results.get() for _ in desks]
+        for p in desks:
+            p.join()
+        problems = _check(path)
+
+    done = sum(t[0] for t in totals)
+    conflicts = sum(t[1] for t in totals)
+    busy = sum(t[2] for t in totals)
+    print(f"{args.writers} desks holding {args.hold} loans, {args.books} books, {args.seconds:g}s, journal={'wal' if args.wal else 'delete'}")
+    print(f"  checkouts (returned):  {done} ({done / args.seconds:.0f}/s)")
+    print(f"  lost compare-and-set:  {conflicts}")
+    print(f"  busy timeouts:         {busy}")
+    print(f"  double-issued copies:  {len(problems)}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
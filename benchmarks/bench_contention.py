@@ -0,0 +1,184 @@
+"""Reader/writer concurrency on one database file, rollback journal vs WAL.
+
+Runs the same mix against a fresh database in each journal mode:
+
+- readers: desks browsing (a page of books, a client's loans), as fast as they can
+- desks: checking a book out and back in
+- one long writer: repricing every open loan's fine in one transaction, as
+  the issue summary used to, then pausing briefly
+
+and reports read and checkout latency plus how many statements still hit
+"database is locked" after waiting BUSY_TIMEOUT_MS. With the rollback
+journal every reader waits behind the long writer; in WAL mode they don't.
+The WAL runs also have a Checkpointer going, and report the -wal file size
+left at the end.
+
+    python benchmarks/bench_contention.py --readers 4 --desks 2 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import setup  # noqa: E402
+from db import (  # noqa: E402
+    FINE_SQL, BookRepo, BookUnavailable, Checkpointer, ConnectionPool, LoanRepo, apply_storage_profile, ensure_indexes,
+    migrate,
+)
+
+NOW = "2024-03-01T00:00:00"
+
+
+def _build(path, n_books, n_loans, journal_mode):
+    conn = sqlite3.connect(path)
+    apply_storage_profile(conn, journal_mode)
+    setup.ensure_tables(conn)
+    conn.executemany(
+        "INSERT INTO book (title, author, status, rack_column_row, year, isbn) VALUES (?,?,?,?,?,?)",
+        [(f"Title {i}", f"Author {i % 97}", 'available', '', 1950 + i % 70, 1000 + i) for i in range(n_books)],
+    )
+    conn.commit()
+    migrate(conn)
+    ensure_indexes(conn)
+    # open loans on the first n_loans books, overdue by up to two months, for the long writer to reprice
+    book_ids = [r[0] for r in conn.execute("SELECT id FROM book ORDER BY id")]
+    conn.executemany(
+        "INSERT INTO loans (client_id, client_username, book_pk, book_title, issued_at, due_date) VALUES (?,?,?,?,?,?)",
+        [(1 + i % 50, None, book_ids[i], f"Title {i}", "2024-01-01T00:00:00", f"2024-01-{1 + i % 28:02d}T00:00:00") for i in range(n_loans)],
+    )
+    conn.executemany("UPDATE book SET status = 'checked out' WHERE id = ?", [(b,) for b in book_ids[:n_loans]])
+    conn.commit()
+    conn.close()
+    return book_ids[n_loans:]
+
+
+def _reader(path, journal_mode, seed, seconds, results):
+    rng = random.Random(seed)
+    pool = ConnectionPool(path, journal_mode=journal_mode)
+    books, loans = BookRepo(pool), LoanRepo(pool)
+    cols = books.columns()
+    latencies, locked = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if rng.random() < 0.5:
+                books.page(cols, f"Title {rng.randrange(1000)}")
+            else:
+                loans.for_client(1 + rng.randrange(50))
+        except sqlite3.OperationalError:
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put(('read', latencies, locked))
+
+
+def _desk(path, journal_mode, desk, book_ids, seconds, results):
+    rng = random.Random(desk)
+    loans = LoanRepo(ConnectionPool(path, journal_mode=journal_mode))
+    latencies, locked = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            loan_id = loans.checkout(100 + desk, None, rng.choice(book_ids), NOW, "2024-03-15T00:00:00", max_loans=10**9)
+            latencies.append(time.perf_counter() - started)
+            loans.return_loan(loan_id, NOW)
+        except BookUnavailable:
+            continue
+        except sqlite3.OperationalError:
+            locked += 1
+    results.put(('checkout', latencies, locked))
+
+
+def _long_writer(path, journal_mode, seconds, pause_s, results):
+    pool = ConnectionPool(path, journal_mode=journal_mode)
+    conn = pool.connection()
+    durations, locked = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            conn.execute(f"UPDATE loans SET fine = {FINE_SQL} WHERE returned_at IS NULL", {'at': NOW})
+            conn.commit()
+            durations.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            conn.rollback()
+            locked += 1
+        time.sleep(pause_s)
+    results.put(('long write', durations, locked))
+
+
+def _percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(journal_mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        free = _build(path, args.books, args.loans, journal_mode)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_reader, args=(path, journal_mode, i, args.seconds, results)) for i in range(args.readers)]
+        procs += [
+            multiprocessing.Process(target=_desk, args=(path, journal_mode, i, free, args.seconds, results))
+            for i in range(args.desks)
+        ]
+        procs.append(multiprocessing.Process(target=_long_writer, args=(path, journal_mode, args.seconds, args.pause, results)))
+        for p in procs:
+            p.start()
+        # started after the fork, so no child inherits a thread holding SQLite's locks
+        checkpointer = None
+        if journal_mode == 'WAL':
+            checkpointer = Checkpointer(path, interval_s=1)
+            checkpointer.start()
+        totals = {}
+        for _ in procs:
+            kind, latencies, locked = results.get()
+            entry = totals.setdefault(kind, [[], 0])
+            entry[0].extend(latencies)
+            entry[1] += locked
+        for p in procs:
+            p.join()
+        wal_bytes = None
+        if checkpointer:
+            checkpointer.stop()
+            wal = path + "-wal"
+            wal_bytes = os.path.getsize(wal) if os.path.exists(wal) else 0
+
+    print(f"journal={journal_mode.lower()}: {args.readers} readers, {args.desks} desks, 1 long writer, {args.seconds:g}s")
+    for kind in ('read', 'checkout', 'long write'):
+        latencies, locked = totals.get(kind, ([], 0))
+        print(
+            f"  {kind:<10} {len(latencies) / args.seconds:8.0f}/s   p50 {_percentile(latencies, 0.5) * 1000:7.1f} ms"
+            f"   p95 {_percentile(latencies, 0.95) * 1000:7.1f} ms   max {max(latencies, default=0) * 1000:7.1f} ms   locked {locked}"
+        )
+    if wal_bytes is not None:
+        print(f"  -wal file after the final checkpoint: {wal_bytes} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--readers", type=int, default=4, help="browsing processes")
+    parser.add_argument("--desks", type=int, default=2, help="checkout/return processes")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long each process runs")
+    parser.add_argument("--books", type=int, default=50000, help="books in the catalogue")
+    parser.add_argument("--loans", type=int, default=40000, help="open loans the long writer reprices")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds the long writer rests between passes")
+    parser.add_argument("--journal", choices=('both', 'delete', 'wal'), default='both')
+    args = parser.parse_args()
+    for mode in (('DELETE', 'WAL') if args.journal == 'both' else (args.journal.upper(),)):
+        run(mode, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
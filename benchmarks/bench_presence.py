@@ -0,0 +1,81 @@
+"""Time missing-book detection over a million shelf-reader readings.
+
+Builds a scratch database with BOOKS tagged books and READINGS readings
+spread over presence.WINDOW_S seconds, a tenth of the books going quiet
+(or weak) halfway through, then times the NumPy verdict pass on its own,
+the first PresenceDetector pass (loading the window out of SQLite, the
+verdicts and the batched status update) and an incremental pass. Most
+of the first pass is loading the window out of SQLite; later passes only
+read what arrived since.
+
+    python benchmarks/bench_presence.py --readings 1000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import presence  # noqa: E402
+from telemetry import append_readings, ensure_readings_table  # noqa: E402
+
+
+def _readings(n, books, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = np.sort(rng.uniform(0, presence.WINDOW_S, n))
+    book = rng.integers(0, books, n)
+    rssi = rng.normal(-55, 5, n)
+    # the first tenth of the books leave the shelf halfway through; the next tenth fade out
+    gone = (book < books // 10) & (ts > presence.WINDOW_S / 2)
+    weak = (book >= books // 10) & (book < books // 5) & (ts > presence.WINDOW_S / 2)
+    rssi[weak] = rng.normal(-88, 3, weak.sum())
+    keep = ~gone
+    return ts[keep], np.round(rssi[keep]), book[keep]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--books", type=int, default=5000)
+    args = parser.parse_args()
+
+    ts, rssi, book = _readings(args.readings, args.books)
+    was = np.ones(args.books, dtype=bool)
+    started = time.perf_counter()
+    present, _, _ = presence.verdicts(ts, rssi, book, args.books, ts.max(), was)
+    core = time.perf_counter() - started
+    print(f"{len(ts)} readings, {args.books} books")
+    print(f"  verdicts (NumPy only):   {core * 1000:.0f} ms, {np.count_nonzero(~present)} missing")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        conn.execute("CREATE TABLE book (id INTEGER PRIMARY KEY, book_code TEXT, status TEXT)")
+        conn.executemany("INSERT INTO book VALUES (?,?,'available')", [(i, f"B{i:05d}") for i in range(args.books)])
+        ensure_readings_table(conn)
+        # as telemetry.py's writer stores them, tag numbers included
+        tags = append_readings(conn, list(zip(ts.tolist(), (f"B{b:05d}" for b in book.tolist()), rssi.astype(int).tolist(), [None] * len(ts))), {})
+        conn.commit()
+        detector = presence.PresenceDetector(conn)
+        started = time.perf_counter()
+        loaded = detector.refresh()
+        load = time.perf_counter() - started
+        changed = detector.detect()
+        full = time.perf_counter() - started
+        print(f"  first pass, window load: {load * 1000:.0f} ms for {loaded} readings")
+        print(f"  first pass, total:       {full * 1000:.0f} ms, marked {changed['lost']} lost")
+        append_readings(conn, [(float(ts.max()) + 1, "B00000", -50, None)] * 1000, tags)
+        conn.commit()
+        started = time.perf_counter()
+        changed = detector.detect()
+        print(f"  next detect(), 1k new:   {(time.perf_counter() - started) * 1000:.0f} ms, marked {changed['available']} available")
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
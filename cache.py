@@ -0,0 +1,110 @@
+"""In-memory reuse of filter results for type-ahead search.
+
+Extending a filter ("har" -> "harr") can only narrow its result, so once a
+filter's complete result is cached, any longer filter that starts with it is
+answered by re-checking those rows in Python instead of asking SQLite again.
+Entries are tagged with ConnectionPool.change_epoch(); a commit from any
+connection moves the epoch and retires everything cached before it. They
+are also keyed by the matcher that produced them (book search uses FTS
+for some filters and LIKE for others), and a filter is only refined from
+an entry its own matcher produced, or from the unfiltered list. Refined
+rows keep the order of the entry they came from, which is only right for
+unranked results; FTS results come back in bm25 order, and bm25 changes as
+the filter grows, so ranked filters always go to SQLite and are not cached.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+# results larger than this are paged from SQLite and never cached
+REFINE_MAX_ROWS = 2000
+# rough cap on the memory held by cached rows
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+# matchers whose results come in rank order rather than rowid order; never served from memory
+RANKED_MATCHERS = frozenset({'fts'})
+
+
+def _row_size(row):
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+
+
+class RefinementCache:
+    """LRU of complete filter results keyed by (scope, columns, matcher, filter text)."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_rows=REFINE_MAX_ROWS):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def first_page(self, scope, cols, filter_text, epoch, fetch_page, row_filter, matcher=None):
+        """First (rows, next_after) page for filter_text, from memory when a shorter filter is cached.
+
+        fetch_page(after, limit) reads from the DB; row_filter(cols, text)
+        returns a predicate that re-applies a filter to a cached row, built
+        once per call rather than per row. matcher(text), if given, names
+        how the DB filters for text (e.g. 'fts' or 'like'). Complete results
+        (next_after is None) of up to max_rows rows are cached for the next
+        refinement. Filters a RANKED_MATCHERS matcher answers are always
+        fetched.
+        """
+        cols = tuple(cols)
+        kind = matcher or (lambda text: None)
+        wanted = kind(filter_text)
+        if wanted in RANKED_MATCHERS:
+            return fetch_page(None, self.max_rows)
+        with self._lock:
+            # longest cached prefix first: it is the smallest superset
+            for end in range(len(filter_text), -1, -1):
+                prefix = filter_text[:end]
+                # a differently matched prefix is no superset ("!" by LIKE vs "!!a" by FTS); the unfiltered list always is
+                key = (scope, cols, kind(prefix), prefix)
+                if prefix and key[2] != wanted:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] != epoch:
+                    self._drop(key)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                rows = entry[1]
+                break
+            else:
+                rows = None
+                self.misses += 1
+        if rows is not None:
+            if end < len(filter_text):
+                rows = list(filter(row_filter(cols, filter_text), rows))
+                self._put((scope, cols, wanted, filter_text), epoch, rows)
+            return rows, None
+
+        rows, next_after = fetch_page(None, self.max_rows)
+        if next_after is None:
+            self._put((scope, cols, wanted, filter_text), epoch, rows)
+        return rows, next_after
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _put(self, key, epoch, rows):
+        size = sum(_row_size(r) for r in rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (epoch, rows, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
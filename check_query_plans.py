@@ -0,0 +1,185 @@
+"""Check that none of Rack-Track's queries falls back to a table scan.
+
+Builds a scratch database with the app schema and index set, drives every
+repo method the windows use while recording each statement, then runs
+EXPLAIN QUERY PLAN over every distinct one. A plan step that scans a whole
+table (or a whole non-partial index) is reported, and the script exits 1.
+
+    python check_query_plans.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+import setup
+from db import AdminRepo, BookRepo, ClientRepo, ConnectionPool, LoanRepo, ensure_book_fts, ensure_indexes, migrate
+
+# statements allowed to walk a whole table, with the reason
+ALLOWED_SCANS = {
+    "(username LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\')": "substring filter on the client list; no index can serve it",
+}
+
+
+class _RecordingCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        self.connection.statements.append((sql, params))
+        return super().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        # one parameter set is enough to EXPLAIN the statement
+        seq_of_params = list(seq_of_params)
+        if seq_of_params:
+            self.connection.statements.append((sql, seq_of_params[0]))
+        return super().executemany(sql, seq_of_params)
+
+
+class _RecordingConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = []
+
+    def cursor(self, factory=_RecordingCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts open a plain cursor, so they are routed through cursor()
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def _build(path):
+    conn = sqlite3.connect(path)
+    setup.ensure_tables(conn)
+    conn.executemany(
+        "INSERT INTO book (title, author, status, rack_column_row, year, isbn, book_code, cabinet, rack, shelf_row) VALUES (?,?,?,?,?,?,?,?,?,?)",
+        [
+            (f"Title {i}", f"Author {i % 7}", 'available', f"{i % 3}-{i % 5}-{i % 4}", 1990 + i % 30, 1000 + i, f"B{i:03d}", i % 3, i % 5, i % 4)
+            for i in range(50)
+        ],
+    )
+    conn.commit()
+    migrate(conn)
+    ensure_indexes(conn)
+    ensure_book_fts(conn, rebuild=True)
+    # no ANALYZE: stats from a handful of rows would make scans look cheap
+    conn.close()
+
+
+def _exercise(pool):
+    """Call every repo method the windows use, with representative arguments."""
+    books, clients, admins, loans = BookRepo(pool), ClientRepo(pool), AdminRepo(pool), LoanRepo(pool)
+    cols = books.columns()
+    for kwargs in ({}, {'status': 'lost'}, {'match_year': True}):
+        books.page(cols, '', **kwargs)
+        books.page(cols, 'title', **kwargs)
+        rows, after = books.page(cols, 'title', limit=2, **kwargs)
+        books.page(cols, 'title', after=after, limit=2, **kwargs)
+    books.page(cols, '1995', match_year=True)
+    for shelf in ((1,), (1, 2), (1, 2, 3)):
+        rows, after = books.shelf(cols, *shelf, limit=2)
+        books.shelf(cols, *shelf, after=after, limit=2)
+    books.locate(cols, 'B007')
+    # migrate numbers the books 1-50 in rowid order; book_assign_id gives the next one 51
+    books.get(2)
+    books.add('New', 'Someone', 'available', '', 2001, 99)
+    books.update(51, 'New', 'Someone', 'lost', '', 2001, 99)
+    books.delete(51)
+
+    ccols = clients.columns()
+    clients.page(ccols, '')
+    clients.page(ccols, 'a')
+    pk = clients.primary_key()
+    clients.get(pk, 1)
+    clients.get_by_id(1)
+    clients.authenticate('a', 'a')
+    clients.add('b', 'b', 'b@example.com')
+    clients.update(pk, 2, 'b', 'c', 'b@example.com')
+    clients.set_password(2, 'd')
+    clients.delete(pk, 2)
+    admins.authenticate('admin', 'admin')
+
+    loans.ensure_table()
+    loans.outstanding_count(1)
+    loans.outstanding_count(None, 'a')
+    loans.for_client(1)
+    loans.for_client(None, 'a')
+    loans.checkout(1, 'a', 2, '2024-01-01T00:00:00', '2024-01-15T00:00:00', 5)
+    loans.return_loan(1, '2024-01-10T00:00:00')
+    loans.issue_summary('2024-02-01T00:00:00')
+    pool.change_epoch()
+
+
+def _partial_indexes(conn):
+    names = set()
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+        for row in conn.execute(f"PRAGMA index_list({table})"):
+            if row[4]:
+                names.add(row[1])
+    return names
+
+
+def _filters_beyond_keyset(sql):
+    """Whether the statement's WHERE has conditions besides the keyset `rowid > ?`."""
+    upper = sql.upper()
+    if " WHERE " not in upper:
+        return False
+    where = upper.split(" WHERE ", 1)[1].split(" ORDER BY ", 1)[0]
+    terms = [t.strip() for t in where.split(" AND ")]
+    return any(t not in ("1", "ROWID > ?", "BOOK.ROWID > ?") for t in terms)
+
+
+def _scans(conn, sql, params, partial):
+    """Plan steps of one statement that read a whole table or non-partial index.
+
+    A rowid range walk ("rowid>?") counts as a scan when the statement also
+    filters on something else: the walk only stops once LIMIT rows pass it.
+    """
+    bad = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+        detail = row[3]
+        if detail.startswith("SEARCH ") and "INTEGER PRIMARY KEY (rowid>?)" in detail:
+            if _filters_beyond_keyset(sql):
+                bad.append(detail)
+            continue
+        if not detail.startswith("SCAN ") or "VIRTUAL TABLE" in detail or detail == "SCAN CONSTANT ROW":
+            continue
+        words = detail.split()
+        index = words[words.index("INDEX") + 1] if "INDEX" in words else None
+        if index not in partial:
+            bad.append(detail)
+    return bad
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plans.db")
+        _build(path)
+        pool = ConnectionPool(path, factory=_RecordingConnection)
+        _exercise(pool)
+        conn = pool.connection()
+        # one sample of each distinct query statement, in the order first issued
+        statements = {}
+        for sql, params in conn.statements:
+            if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE', 'WITH'):
+                statements.setdefault(sql, params)
+        partial = _partial_indexes(conn)
+        failures = 0
+        for sql, params in statements.items():
+            if any(fragment in sql for fragment in ALLOWED_SCANS):
+                continue
+            bad = _scans(conn, sql, params, partial)
+            if bad:
+                failures += 1
+                print(f"SCAN: {' '.join(sql.split())}")
+                for detail in bad:
+                    print(f"    {detail}")
+        pool.close_all()
+    print(f"{len(statements)} statements checked, {failures} with table scans.")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
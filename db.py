@@ -0,0 +1,1001 @@
+"""Data-access layer for Rack-Track.
+
+ConnectionPool hands every thread its own sqlite3 connection, so the windows
+can push queries onto worker threads without sharing one handle. The repos
+keep their SQL as fixed strings: sqlite3 keeps compiled statements in a
+per-connection cache (STATEMENT_CACHE_SIZE) so a repeated click reuses the
+prepared statement instead of parsing and planning it again.
+"""
+import os
+import re
+import sqlite3
+import string
+import threading
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+
+# next to the code, whatever directory the app is started from
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rack-track.db")
+# compiled statements kept per connection (sqlite3 defaults to 128)
+STATEMENT_CACHE_SIZE = 256
+# storage profile every connection gets (apply_storage_profile). WAL lets desks keep reading
+# while one writes, but needs every process on the same host: on a network share use 'DELETE'
+JOURNAL_MODE = 'WAL'
+# how long a statement waits for another connection's lock before "database is locked"
+BUSY_TIMEOUT_MS = 5000
+# bytes of the file read through a memory map instead of read() calls
+MMAP_BYTES = 256 * 1024 * 1024
+# page cache per connection, in KiB (negative cache_size)
+CACHE_KIB = -32000
+# seconds between the background PASSIVE checkpoints (Checkpointer)
+CHECKPOINT_INTERVAL_S = 30
+# rows per keyset page handed to the table views
+PAGE_SIZE = 200
+# fine charged per whole day a loan is overdue
+FINE_PER_DAY = 1
+# fine a loan has accrued as of :at; open loans are priced when read, returned ones keep theirs
+FINE_SQL = f"CASE WHEN due_date IS NOT NULL AND due_date < :at THEN CAST(JULIANDAY(:at) - JULIANDAY(due_date) AS INTEGER) * {FINE_PER_DAY} ELSE 0 END"
+# keyset start: sorts before every rowid / bm25 score
+_FIRST_KEY = -2**63
+
+# every book is addressed by book.id (unique, assigned on insert); loans.book_pk holds it
+BOOK_KEY = 'id'
+# PRAGMA user_version this code expects; migrate() brings older files up to it
+SCHEMA_VERSION = 5
+
+# preferred display order; any other columns found in the table follow these
+BOOK_COLUMNS = ['id', 'book_code', 'title', 'author', 'category', 'status', 'rack_column_row', 'cabinet', 'rack', 'shelf_row', 'year', 'isbn']
+CLIENT_COLUMNS = ['client_id', 'username', 'email', 'password']
+
+# (name, table and columns) for every index the app's queries rely on; the
+# partial ones only cover open loans, which is all the circulation queries read.
+# check_query_plans.py verifies that no query falls back to a table scan.
+INDEXES = [
+    ("idx_book_status", "book(status)"),
+    ("idx_book_year", "book(year)"),
+    # "what is on this shelf": equality on a prefix of (cabinet, rack, shelf_row)
+    ("idx_book_location", "book(cabinet, rack, shelf_row)"),
+    # "where is this book", by the source catalogue's Book_ID
+    ("idx_book_code", "book(book_code)"),
+    ("idx_loans_client", "loans(client_id, issued_at)"),
+    ("idx_loans_username", "loans(client_username, issued_at)"),
+    # covers the issue summary: open loans grouped by client with their due dates
+    ("idx_loans_open_client_due", "loans(client_id, client_username, due_date) WHERE returned_at IS NULL"),
+    ("idx_loans_open_username", "loans(client_username) WHERE returned_at IS NULL"),
+    ("idx_loans_open_due", "loans(due_date) WHERE returned_at IS NULL"),
+    ("idx_loans_book", "loans(book_pk)"),
+    ("idx_loan_counts_open", "loan_counts(outstanding) WHERE outstanding > 0"),
+    ("idx_client_username", "client(username)"),
+    ("idx_admin_username", "admin(username)"),
+]
+
+
+def is_busy(error):
+    """Whether an sqlite3 error is another connection holding a lock past busy_timeout (worth retrying)."""
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+class CirculationError(Exception):
+    """A checkout or return that was refused; nothing was written."""
+
+
+class BookUnavailable(CirculationError):
+    def __init__(self, book_ids):
+        super().__init__(f"Not available: book {', '.join(map(str, book_ids))}.")
+        self.book_ids = list(book_ids)
+
+
+class LoanLimitReached(CirculationError):
+    def __init__(self, count, limit, requested=1):
+        super().__init__(f"{count} outstanding loans, {requested} more requested (max {limit}).")
+        self.count = count
+        self.limit = limit
+        self.requested = requested
+
+
+class LoanNotOpen(CirculationError):
+    def __init__(self, loan_ids):
+        super().__init__(f"Not open: loan {', '.join(map(str, loan_ids))}.")
+        self.loan_ids = list(loan_ids)
+
+
+def _placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+class SchemaCatalog:
+    """Table columns and primary keys, read once and kept until PRAGMA schema_version moves.
+
+    schema_version lives in the database header, so every connection sees the
+    same value and one catalog can serve every thread.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._version = None
+        self._tables = {}
+
+    def _table(self, table):
+        conn = self.pool.connection()
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._tables = {}
+            info = self._tables.get(table)
+        if info is None:
+            rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
+            # (name, pk position) for every column; pk position 0 means not part of the key
+            info = ([r[1] for r in rows], [r[1] for r in sorted(rows, key=lambda r: r[5]) if r[5]])
+            with self._lock:
+                if version == self._version:
+                    self._tables[table] = info
+        return info
+
+    def columns(self, table):
+        """Column names in table order; empty when the table doesn't exist."""
+        return list(self._table(table)[0])
+
+    def primary_key(self, table):
+        """The table's primary key columns (empty for rowid-only tables)."""
+        return list(self._table(table)[1])
+
+    def has_table(self, table):
+        return bool(self._table(table)[0])
+
+
+def apply_storage_profile(conn, journal_mode=JOURNAL_MODE):
+    """Set the pragmas every Rack-Track connection runs with.
+
+    journal_mode is stored in the file, so the first connection switches
+    it for everyone; if another process is mid-transaction the switch is
+    left to the next connection. In WAL mode commits only sync at
+    checkpoints (synchronous=NORMAL): a power cut can lose the last
+    commits but never corrupts the file.
+    """
+    # first, so the journal switch below waits for locks as well
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    try:
+        mode = conn.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0]
+    except sqlite3.OperationalError:
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.execute(f"PRAGMA synchronous = {'NORMAL' if mode.lower() == 'wal' else 'FULL'}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+    conn.execute(f"PRAGMA cache_size = {CACHE_KIB}")
+
+
+def checkpoint(conn, mode='PASSIVE'):
+    """Run a WAL checkpoint; returns (busy, wal frames, frames checkpointed), all -1/0 outside WAL mode."""
+    return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+
+class Checkpointer:
+    """Background thread that checkpoints the WAL every interval_s seconds on its own connection.
+
+    A PASSIVE checkpoint copies whatever no reader still needs and never
+    waits, so it can't hold up a checkout; with it running, commits seldom
+    reach wal_autocheckpoint and have to checkpoint inline. stop() finishes
+    with a TRUNCATE that gives up at once if anyone is busy, so a quiet
+    database doesn't keep a large -wal file around.
+    """
+
+    def __init__(self, path=DB_PATH, interval_s=CHECKPOINT_INTERVAL_S):
+        self.path = path
+        self.interval_s = interval_s
+        # (busy, wal frames, frames checkpointed) from the latest pass
+        self.last = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wal-checkpointer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            apply_storage_profile(conn)
+            while not self._stop.wait(self.interval_s):
+                self._pass(conn, 'PASSIVE')
+            conn.execute("PRAGMA busy_timeout = 0")
+            self._pass(conn, 'TRUNCATE')
+        finally:
+            conn.close()
+
+    def _pass(self, conn, mode):
+        try:
+            self.last = checkpoint(conn, mode)
+        except sqlite3.OperationalError:
+            # locked right now: checkpoints are housekeeping, the next pass catches up
+            pass
+
+
+class ConnectionPool:
+    """One sqlite3 connection per thread, opened on first use.
+
+    `schema` is the SchemaCatalog shared by everything using this pool.
+    Every connection gets the storage profile (apply_storage_profile).
+    """
+
+    def __init__(self, path=DB_PATH, cached_statements=STATEMENT_CACHE_SIZE, factory=sqlite3.Connection, journal_mode=JOURNAL_MODE):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.factory = factory
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._epoch = 0
+        self._seen_versions = {}
+        self.schema = SchemaCatalog(self)
+
+    def connection(self):
+        """Return the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # each connection is only used by the thread that opened it; the
+            # flag just lets close_all() and interrupt() reach it from elsewhere
+            conn = sqlite3.connect(self.path, cached_statements=self.cached_statements, check_same_thread=False, factory=self.factory)
+            conn.row_factory = sqlite3.Row # to access columns by name
+            apply_storage_profile(conn, self.journal_mode)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def change_epoch(self):
+        """A counter that moves whenever the database may have changed, whichever connection changed it.
+
+        PRAGMA data_version only reports commits made by *other* connections,
+        so the connection's own total_changes is checked alongside it. A
+        connection seen for the first time also moves the epoch, since it
+        can't vouch for what happened before it opened.
+        """
+        conn = self.connection()
+        version = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        with self._lock:
+            if self._seen_versions.get(id(conn)) != version:
+                self._seen_versions[id(conn)] = version
+                self._epoch += 1
+            return self._epoch
+
+    def close(self):
+        """Close the calling thread's connection (e.g. when a worker exits)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+            self._seen_versions.pop(id(conn), None)
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            conns, self._connections = self._connections, []
+            self._seen_versions.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+LOANS_DDL = """
+CREATE TABLE IF NOT EXISTS loans (
+    loan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INTEGER,
+    client_username TEXT,
+    book_pk INTEGER REFERENCES book(id),
+    book_title TEXT,
+    issued_at TEXT,
+    due_date TEXT,
+    returned_at TEXT,
+    fine INTEGER
+)
+"""
+
+
+# loan_counts is keyed per client: by client_id, or by username for loans recorded without one
+def _client_key_sql(row):
+    return f"IFNULL('id:' || {row}.client_id, 'user:' || {row}.client_username)"
+
+
+def client_key(client_id, username=''):
+    """The loan_counts key of a client, as _client_key_sql computes it in SQL."""
+    return f"id:{client_id}" if client_id is not None else f"user:{username}"
+
+
+def ensure_loan_counts(conn):
+    """Create the per-client loan counters and the triggers that keep them current.
+
+    outstanding is exact at all times. overdue counts open loans due before
+    loan_counts_state.overdue_as_of; LoanRepo.advance_overdue moves that
+    watermark forward, counting only the loans that fell due in between.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan_counts (
+            client_key TEXT PRIMARY KEY,
+            client_id INTEGER,
+            client_username TEXT,
+            outstanding INTEGER NOT NULL DEFAULT 0,
+            overdue INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS loan_counts_state (id INTEGER PRIMARY KEY CHECK (id = 1), overdue_as_of TEXT)")
+    conn.execute("INSERT OR IGNORE INTO loan_counts_state (id, overdue_as_of) VALUES (1, NULL)")
+    counted_overdue = "IFNULL({row}.due_date < (SELECT overdue_as_of FROM loan_counts_state WHERE id = 1), 0)"
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS loan_counts_issue AFTER INSERT ON loans WHEN new.returned_at IS NULL BEGIN
+            INSERT INTO loan_counts (client_key, client_id, client_username, outstanding, overdue)
+            VALUES ({_client_key_sql('new')}, new.client_id, new.client_username, 1, {counted_overdue.format(row='new')})
+            ON CONFLICT (client_key) DO UPDATE SET
+                outstanding = outstanding + 1, overdue = overdue + excluded.overdue, client_username = excluded.client_username;
+        END
+        """
+    )
+    for name, event, when in (
+        ("loan_counts_return", "UPDATE OF returned_at", "old.returned_at IS NULL AND new.returned_at IS NOT NULL"),
+        ("loan_counts_delete", "DELETE", "old.returned_at IS NULL"),
+    ):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON loans WHEN {when} BEGIN
+                UPDATE loan_counts SET outstanding = outstanding - 1, overdue = overdue - {counted_overdue.format(row='old')}
+                WHERE client_key = {_client_key_sql('old')};
+            END
+            """
+        )
+
+
+def rebuild_loan_counts(conn, now_iso):
+    """Recount loan_counts from the loans table in one pass, with the overdue watermark at now_iso."""
+    conn.execute("DELETE FROM loan_counts")
+    conn.execute(
+        f"""
+        INSERT INTO loan_counts (client_key, client_id, client_username, outstanding, overdue)
+        SELECT {_client_key_sql('loans')}, MAX(client_id), MAX(client_username), COUNT(*), SUM(IFNULL(due_date < :at, 0))
+        FROM loans WHERE returned_at IS NULL GROUP BY 1
+        """,
+        {'at': now_iso},
+    )
+    conn.execute("UPDATE loan_counts_state SET overdue_as_of = ? WHERE id = 1", (now_iso,))
+    conn.commit()
+
+
+def ensure_indexes(conn):
+    """Create any missing index from INDEXES."""
+    for name, target in INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    conn.commit()
+
+
+def _migrate_book_key(conn):
+    """Make book.id the one integer key for books and point loans.book_pk at it.
+
+    Older files could have books with no id (rows added after the column
+    was), and stored book_pk as TEXT holding either an id or an isbn, which
+    forced `isbn = ? OR id = ?` lookups.
+    """
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(book)")]
+    if 'id' not in cols:
+        conn.execute("ALTER TABLE book ADD COLUMN id INTEGER")
+    next_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM book").fetchone()[0]
+    missing = [r[0] for r in conn.execute("SELECT rowid FROM book WHERE id IS NULL ORDER BY rowid")]
+    conn.executemany("UPDATE book SET id = ? WHERE rowid = ?", [(next_id + i + 1, rowid) for i, rowid in enumerate(missing)])
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_book_id ON book(id)")
+
+    loan_cols = {r[1]: r[2].upper() for r in conn.execute("PRAGMA table_info(loans)")}
+    if loan_cols.get('book_pk', 'INTEGER') == 'INTEGER':
+        return
+    # rebuild loans with an INTEGER book_pk, resolving old values as an id first, then as an isbn
+    conn.execute(LOANS_DDL.replace("CREATE TABLE IF NOT EXISTS loans", "CREATE TABLE loans_new"))
+    conn.execute(
+        """
+        INSERT INTO loans_new (loan_id, client_id, client_username, book_pk, book_title, issued_at, due_date, returned_at, fine)
+        SELECT loan_id, client_id, client_username,
+               COALESCE((SELECT id FROM book WHERE id = CAST(l.book_pk AS INTEGER)),
+                        (SELECT id FROM book WHERE isbn = CAST(l.book_pk AS INTEGER)),
+                        CAST(l.book_pk AS INTEGER)),
+               book_title, issued_at, due_date, returned_at, fine
+        FROM loans AS l
+        """
+    )
+    conn.execute("DROP TABLE loans")
+    conn.execute("ALTER TABLE loans_new RENAME TO loans")
+
+
+def _migrate_book_id_seq(conn):
+    """Hand out book ids from book_id_seq, a counter that only goes up.
+
+    MAX(id) + 1 gave a deleted book's id (and after a REPLACE_BOOKS wipe,
+    id 1 onwards) to the next book, and loans.book_pk still pointing at the
+    old id then joined to it. The counter starts past every id a book or a
+    loan has used.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS book_id_seq (id INTEGER PRIMARY KEY CHECK (id = 1), last_id INTEGER NOT NULL)")
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO book_id_seq (id, last_id)
+        SELECT 1, MAX((SELECT IFNULL(MAX(id), 0) FROM book), (SELECT IFNULL(MAX(book_pk), 0) FROM loans))
+        """
+    )
+    conn.execute("DROP TRIGGER IF EXISTS book_assign_id")
+    conn.execute(
+        """
+        CREATE TRIGGER book_assign_id AFTER INSERT ON book WHEN new.id IS NULL BEGIN
+            UPDATE book_id_seq SET last_id = last_id + 1 WHERE id = 1;
+            UPDATE book SET id = (SELECT last_id FROM book_id_seq WHERE id = 1) WHERE rowid = new.rowid;
+        END
+        """
+    )
+
+
+def reserve_book_ids(conn, n):
+    """Take n ids off book_id_seq in conn's open transaction; returns the first.
+
+    For loaders that give books their id in the INSERT. A rollback gives
+    the ids back, so reserve again after one.
+    """
+    if not n:
+        return None
+    conn.execute("UPDATE book_id_seq SET last_id = last_id + ? WHERE id = 1", (n,))
+    return conn.execute("SELECT last_id FROM book_id_seq WHERE id = 1").fetchone()[0] - n + 1
+
+
+# columns added to book by schema version 4, with their types
+BOOK_LOCATION_COLUMNS = [
+    ('book_code', 'TEXT'),
+    ('category', 'TEXT'),
+    ('cabinet', 'INTEGER'),
+    ('rack', 'INTEGER'),
+    ('shelf_row', 'INTEGER'),
+]
+
+
+def parse_location(text):
+    """(cabinet, rack, shelf_row) from a rack_column_row text like "4-5-2"; all None if it isn't one."""
+    m = re.fullmatch(r"\s*(\d+)\D+(\d+)\D+(\d+)\s*", text or '')
+    return tuple(int(g) for g in m.groups()) if m else (None, None, None)
+
+
+def format_location(cabinet, rack, shelf_row):
+    """The rack_column_row text kept alongside the integer location columns."""
+    return f"{cabinet}-{rack}-{shelf_row}" if cabinet is not None else ''
+
+
+def _migrate_book_location(conn):
+    """Give book integer cabinet/rack/shelf_row columns (plus category and the source Book_ID).
+
+    Existing rack_column_row texts that read as three numbers are copied over.
+    """
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(book)")]
+    for name, kind in BOOK_LOCATION_COLUMNS:
+        if name not in cols:
+            conn.execute(f"ALTER TABLE book ADD COLUMN {name} {kind}")
+    located = []
+    for rowid, text in conn.execute("SELECT rowid, rack_column_row FROM book WHERE rack_column_row <> ''"):
+        location = parse_location(text)
+        if location[0] is not None:
+            located.append(location + (rowid,))
+    conn.executemany("UPDATE book SET cabinet = ?, rack = ?, shelf_row = ? WHERE rowid = ?", located)
+
+
+def migrate(conn):
+    """Upgrade an existing database file to SCHEMA_VERSION. Expects the app tables (ensure_tables) to exist."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    if version < 1:
+        _migrate_book_key(conn)
+    if version < 2:
+        # superseded by idx_loans_open_client_due
+        conn.execute("DROP INDEX IF EXISTS idx_loans_open_client")
+    if version < 3:
+        ensure_loan_counts(conn)
+        rebuild_loan_counts(conn, datetime.now().isoformat())
+    if version < 4:
+        _migrate_book_location(conn)
+    if version < 5:
+        _migrate_book_id_seq(conn)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    # indexes on a rebuilt table are gone; put them back
+    ensure_indexes(conn)
+
+
+def fts5_available(conn):
+    """True when this SQLite build can create FTS5 tables."""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def ensure_book_fts(conn, rebuild=False):
+    """Create the `book_fts` shadow index over book(title, author, isbn) and its triggers.
+
+    The index is external-content (it stores no copy of the text), so the
+    triggers only have to mirror inserts, deletes and edits of those three
+    columns. Pass rebuild=True after bulk changes made with the triggers
+    missing. Returns False when FTS5 is not compiled in.
+    """
+    if not fts5_available(conn):
+        return False
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(title, author, isbn, content='book', content_rowid='rowid')")
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN
+            INSERT INTO book_fts(rowid, title, author, isbn) VALUES (new.rowid, new.title, new.author, new.isbn);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN
+            INSERT INTO book_fts(book_fts, rowid, title, author, isbn) VALUES ('delete', old.rowid, old.title, old.author, old.isbn);
+        END
+        """
+    )
+    # status changes (checkout/return) don't touch the index
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title, author, isbn ON book BEGIN
+            INSERT INTO book_fts(book_fts, rowid, title, author, isbn) VALUES ('delete', old.rowid, old.title, old.author, old.isbn);
+            INSERT INTO book_fts(rowid, title, author, isbn) VALUES (new.rowid, new.title, new.author, new.isbn);
+        END
+        """
+    )
+    if rebuild:
+        conn.execute("INSERT INTO book_fts(book_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must prefix-match a token.
+
+    "tolk hobb" becomes '"tolk"* "hobb"*'. Returns '' when text has no words.
+    """
+    return " ".join(f'"{t}"*' for t in re.findall(r'[^\W_]+', text))
+
+
+def _fold(text):
+    """Lower-case and strip accents, roughly what FTS5's unicode61 tokenizer does."""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+# SQLite's LIKE folds case for ASCII letters only
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def like_pattern(text):
+    """`%text%` for `LIKE ? ESCAPE '\\'`, with text's own % and _ matched literally."""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _like_filter(cols, filter_text, searched):
+    """Row predicate equivalent to `col LIKE like_pattern(filter_text) ESCAPE '\\'` over the searched columns."""
+    needle = filter_text.translate(_ASCII_LOWER)
+    at = [i for i, c in enumerate(cols) if c in searched]
+    return lambda row: any(row[i] is not None and needle in str(row[i]).translate(_ASCII_LOWER) for i in at)
+
+
+def _ordered_columns(cols, preferred):
+    ordered = [c for c in preferred if c in cols]
+    for c in cols:
+        if c not in ordered:
+            ordered.append(c)
+    return ordered
+
+
+class _Repo:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _fetchall(self, sql, params=()):
+        cur = self.pool.connection().cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+    def _fetchone(self, sql, params=()):
+        cur = self.pool.connection().cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.fetchone()
+        finally:
+            cur.close()
+
+    @contextmanager
+    def _immediate(self):
+        """Cursor inside BEGIN IMMEDIATE: commits on success, rolls back on any error.
+
+        Taking the write lock up front means reads made inside the block
+        can't be invalidated by another writer before this one commits.
+        """
+        conn = self.pool.connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            yield cur
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def _write(self, sql, params=()):
+        """Run one write statement, commit, and return the affected row count."""
+        conn = self.pool.connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, params)
+            conn.commit()
+            return cur.rowcount
+        finally:
+            cur.close()
+
+    def _table_columns(self, table):
+        return self.pool.schema.columns(table)
+
+
+class BookRepo(_Repo):
+    def has_fts(self):
+        """True once setup.py has built `book_fts`; otherwise searches use LIKE."""
+        return self.pool.schema.has_table('book_fts')
+
+    def columns(self):
+        """Return list of book columns in preferred order depending on DB."""
+        return _ordered_columns(self._table_columns('book'), BOOK_COLUMNS)
+
+    def _matching(self, filter_text, match_year=False):
+        """FROM/WHERE clause and params for books matching filter_text, plus whether it is ranked.
+
+        Uses the FTS5 index (rankable with bm25) when it exists; otherwise falls
+        back to substring LIKE over title/author/isbn. With match_year a numeric
+        filter_text also matches the year column; those results come unranked.
+        """
+        year = int(filter_text) if match_year and filter_text.isdigit() else None
+        query = fts_query(filter_text)
+        if query and self.has_fts():
+            if year is None:
+                return "book_fts JOIN book ON book.rowid = book_fts.rowid WHERE book_fts MATCH ?", (query,), True
+            return "book WHERE (book.rowid IN (SELECT rowid FROM book_fts WHERE book_fts MATCH ?) OR year = ?)", (query, year), False
+        like = like_pattern(filter_text)
+        return (
+            "book WHERE (title LIKE ? ESCAPE '\\' OR author LIKE ? ESCAPE '\\' OR isbn LIKE ? ESCAPE '\\' OR year = ?)",
+            (like, like, like, year),
+            False,
+        )
+
+    def page(self, cols, filter_text='', after=None, limit=PAGE_SIZE, status=None, match_year=False):
+        """One keyset page of `cols` for books matching filter_text (and status, if given).
+
+        Returns (rows, next_after); next_after is None once the result is
+        exhausted. Unfiltered and LIKE pages walk rowid order, FTS pages walk
+        (bm25, rowid) order so the best matches come first.
+        """
+        select = ",".join(f"book.{c}" for c in cols)
+        if not filter_text:
+            source, params, ranked = "book WHERE 1", (), False
+        else:
+            source, params, ranked = self._matching(filter_text, match_year)
+        if status is not None:
+            source += " AND book.status = ?"
+            params += (status,)
+        if ranked:
+            rank, key = after if after is not None else (float('-inf'), _FIRST_KEY)
+            rows = self._fetchall(
+                f"SELECT * FROM (SELECT {select}, bm25(book_fts) AS _rank, book.rowid AS _key FROM {source}) "
+                "WHERE (_rank, _key) > (?, ?) ORDER BY _rank, _key LIMIT ?",
+                params + (rank, key, limit),
+            )
+            next_after = (rows[-1]['_rank'], rows[-1]['_key']) if len(rows) == limit else None
+        else:
+            rows = self._fetchall(
+                f"SELECT {select}, book.rowid AS _key FROM {source} AND book.rowid > ? ORDER BY book.rowid LIMIT ?",
+                params + (after if after is not None else _FIRST_KEY, limit),
+            )
+            next_after = rows[-1]['_key'] if len(rows) == limit else None
+        return [tuple(r)[:len(cols)] for r in rows], next_after
+
+    def refine_rules(self):
+        """(row_filter, matcher) for RefinementCache.first_page, with FTS availability looked up once.
+
+        matcher(text) is 'fts' or 'like': how page() filters for text (results
+        of one are no subset of the other). row_filter(cols, text) returns a
+        predicate telling whether a row fetched by page(cols, ...) also
+        matches text, by the same rules.
+        """
+        fts = self.has_fts()
+
+        def matcher(filter_text):
+            return 'fts' if fts and fts_query(filter_text) else 'like'
+
+        def row_filter(cols, filter_text):
+            if matcher(filter_text) == 'like':
+                return _like_filter(cols, filter_text, ('title', 'author', 'isbn'))
+            at = [i for i, c in enumerate(cols) if c in ('title', 'author', 'isbn')]
+            terms = re.findall(r'[^\W_]+', _fold(filter_text))
+
+            def matches(row):
+                tokens = set()
+                for i in at:
+                    if row[i] is not None:
+                        tokens.update(re.findall(r'[^\W_]+', _fold(row[i])))
+                return all(any(t.startswith(term) for t in tokens) for term in terms)
+            return matches
+
+        return row_filter, matcher
+
+    def shelf(self, cols, cabinet, rack=None, shelf_row=None, after=None, limit=PAGE_SIZE):
+        """One page of the books in a cabinet, or one rack of it, or one row of that rack, in shelf order.
+
+        An equality prefix of idx_book_location, walked by keyset on
+        (rack, shelf_row, rowid). Returns (rows, next_after) like page().
+        """
+        select = ",".join(f"book.{c}" for c in cols)
+        where, params = "cabinet = ?", (cabinet,)
+        if rack is not None:
+            where += " AND rack = ?"
+            params += (rack,)
+            if shelf_row is not None:
+                where += " AND shelf_row = ?"
+                params += (shelf_row,)
+        if after is not None:
+            where += " AND (rack, shelf_row, book.rowid) > (?, ?, ?)"
+            params += tuple(after)
+        rows = self._fetchall(
+            f"SELECT {select}, rack AS _rack, shelf_row AS _row, book.rowid AS _key FROM book WHERE {where} "
+            "ORDER BY rack, shelf_row, book.rowid LIMIT ?",
+            params + (limit,),
+        )
+        next_after = (rows[-1]['_rack'], rows[-1]['_row'], rows[-1]['_key']) if len(rows) == limit else None
+        return [tuple(r)[:len(cols)] for r in rows], next_after
+
+    def locate(self, cols, book_code):
+        """Books with this source Book_ID (e.g. "B042"), as a (rows, None) page; one lookup on idx_book_code."""
+        select = ",".join(f"book.{c}" for c in cols)
+        rows = self._fetchall(f"SELECT {select} FROM book WHERE book_code = ?", (book_code,))
+        return [tuple(r) for r in rows], None
+
+    def get(self, book_id):
+        """The book with this id (one lookup on idx_book_id), or None."""
+        return self._fetchone("SELECT * FROM book WHERE id = ?", (book_id,))
+
+    # the integer location columns follow the rack_column_row text the dialogs edit
+    def add(self, title, author, status, rcr, year, isbn):
+        return self._write(
+            "INSERT INTO book(title,author,status,rack_column_row,year,isbn,cabinet,rack,shelf_row) VALUES(?,?,?,?,?,?,?,?,?)",
+            (title, author, status, rcr, year or None, isbn) + parse_location(rcr),
+        )
+
+    def update(self, book_id, title, author, status, rcr, year, isbn):
+        return self._write(
+            "UPDATE book SET title=?,author=?,status=?,rack_column_row=?,year=?,isbn=?,cabinet=?,rack=?,shelf_row=? WHERE id=?",
+            (title, author, status, rcr, year or None, isbn) + parse_location(rcr) + (book_id,),
+        )
+
+    def delete(self, book_id):
+        return self._write("DELETE FROM book WHERE id = ?", (book_id,))
+
+
+class ClientRepo(_Repo):
+    def columns(self):
+        return _ordered_columns(self._table_columns('client'), CLIENT_COLUMNS)
+
+    def primary_key(self):
+        pk = self.pool.schema.primary_key('client')
+        return pk[0] if pk else 'client_id'
+
+    def page(self, cols, filter_text='', after=None, limit=PAGE_SIZE):
+        """One rowid-ordered page of `cols` for clients whose username or email contains filter_text.
+
+        Returns (rows, next_after) like BookRepo.page.
+        """
+        sql = f"SELECT {','.join(cols)}, rowid AS _key FROM client WHERE rowid > ?"
+        params = (after if after is not None else _FIRST_KEY,)
+        if filter_text:
+            sql += " AND (username LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\')"
+            params += (like_pattern(filter_text), like_pattern(filter_text))
+        rows = self._fetchall(sql + " ORDER BY rowid LIMIT ?", params + (limit,))
+        next_after = rows[-1]['_key'] if len(rows) == limit else None
+        return [tuple(r)[:len(cols)] for r in rows], next_after
+
+    def row_filter(self, cols, filter_text):
+        """Predicate for RefinementCache.first_page: whether a row from page(cols, ...) matches filter_text."""
+        return _like_filter(cols, filter_text, ('username', 'email'))
+
+    def get(self, pk_col, pk_value):
+        return self._fetchone(f"SELECT * FROM client WHERE {pk_col} = ?", (pk_value,))
+
+    def get_by_id(self, client_id):
+        return self._fetchone("SELECT * FROM client WHERE client_id = ?", (client_id,))
+
+    def authenticate(self, username, password):
+        """Return the client's id for valid credentials, otherwise None."""
+        row = self._fetchone("SELECT client_id FROM client WHERE username = ? AND password = ?", (username, password))
+        return row['client_id'] if row else None
+
+    def add(self, username, password, email):
+        return self._write("INSERT INTO client(username,password,email) VALUES(?,?,?)", (username, password, email))
+
+    def update(self, pk_col, pk_value, username, password, email):
+        return self._write(
+            f"UPDATE client SET username=?,password=?,email=? WHERE {pk_col}=?",
+            (username, password, email, pk_value),
+        )
+
+    def set_password(self, client_id, password):
+        return self._write("UPDATE client SET password = ? WHERE client_id = ?", (str(password), str(client_id)))
+
+    def delete(self, pk_col, pk_value):
+        return self._write(f"DELETE FROM client WHERE {pk_col} = ?", (pk_value,))
+
+
+class AdminRepo(_Repo):
+    def authenticate(self, username, password):
+        return self._fetchone("SELECT 1 FROM admin WHERE username = ? AND password = ?", (username, password)) is not None
+
+
+class LoanRepo(_Repo):
+    def ensure_table(self):
+        """Create a simple loans table for issue/return tracking if it doesn't exist."""
+        conn = self.pool.connection()
+        conn.execute(LOANS_DDL)
+        ensure_loan_counts(conn)
+        conn.commit()
+
+    def outstanding_count(self, client_id, username=''):
+        """Open loans of one client, read from its loan_counts row."""
+        row = self._fetchone("SELECT outstanding FROM loan_counts WHERE client_key = ?", (client_key(client_id, username),))
+        return row[0] if row else 0
+
+    def rebuild_counters(self, now_iso):
+        """Recount loan_counts from loans, e.g. after editing loans by hand."""
+        rebuild_loan_counts(self.pool.connection(), now_iso)
+
+    def advance_overdue(self, now_iso):
+        """Add loans that fell due since the overdue watermark to loan_counts.overdue.
+
+        Reads only open loans due in [watermark, now_iso) from idx_loans_open_due.
+        """
+        # under the write lock, so two windows can't count the same range twice
+        with self._immediate() as cur:
+            cur.execute("SELECT overdue_as_of FROM loan_counts_state WHERE id = 1")
+            row = cur.fetchone()
+            since = row[0] if row and row[0] is not None else ''
+            if now_iso <= since:
+                return
+            cur.execute(
+                f"""
+                SELECT {_client_key_sql('loans')}, COUNT(*) FROM loans
+                WHERE returned_at IS NULL AND due_date >= ? AND due_date < ? GROUP BY 1
+                """,
+                (since, now_iso),
+            )
+            fell_due = [(n, key) for key, n in cur.fetchall()]
+            cur.executemany("UPDATE loan_counts SET overdue = overdue + ? WHERE client_key = ?", fell_due)
+            cur.execute("UPDATE loan_counts_state SET overdue_as_of = ? WHERE id = 1", (now_iso,))
+
+    def for_client(self, client_id, username=''):
+        """Loans of one client, newest first."""
+        if client_id is not None:
+            return self._fetchall(
+                "SELECT loan_id, book_pk, book_title, issued_at, due_date, returned_at FROM loans WHERE client_id = ? ORDER BY issued_at DESC",
+                (client_id,),
+            )
+        return self._fetchall(
+            "SELECT loan_id, book_pk, book_title, issued_at, due_date, returned_at FROM loans WHERE client_username = ? ORDER BY issued_at DESC",
+            (username,),
+        )
+
+    def checkout(self, client_id, username, book_id, issued_at, due_date, max_loans):
+        """Lend one book; returns the new loan_id. See checkout_many."""
+        return self.checkout_many(client_id, username, [book_id], issued_at, due_date, max_loans)[0]
+
+    def checkout_many(self, client_id, username, book_ids, issued_at, due_date, max_loans):
+        """Lend a cart of books to a client as one BEGIN IMMEDIATE transaction.
+
+        The loan limit is checked once for the whole cart, and either every
+        book is lent or none is. Books are claimed with a compare-and-set on
+        their status, so of two desks lending the same copy only one wins.
+        Returns the new loan_ids in cart order; raises LoanLimitReached or
+        BookUnavailable (after rolling back) otherwise.
+        """
+        book_ids = list(dict.fromkeys(book_ids))
+        if not book_ids:
+            return []
+        with self._immediate() as cur:
+            cur.execute("SELECT outstanding FROM loan_counts WHERE client_key = ?", (client_key(client_id, username),))
+            row = cur.fetchone()
+            count = row[0] if row else 0
+            if count + len(book_ids) > max_loans:
+                raise LoanLimitReached(count, max_loans, len(book_ids))
+            cur.execute(f"SELECT id FROM book WHERE id IN ({_placeholders(book_ids)}) AND status = 'available'", book_ids)
+            available = {r[0] for r in cur.fetchall()}
+            if len(available) != len(book_ids):
+                raise BookUnavailable([b for b in book_ids if b not in available])
+            cur.executemany("UPDATE book SET status = 'checked out' WHERE id = ? AND status = 'available'", [(b,) for b in book_ids])
+            if cur.rowcount != len(book_ids):
+                raise BookUnavailable(book_ids)
+            cur.executemany(
+                "INSERT INTO loans (client_id, client_username, book_pk, book_title, issued_at, due_date, returned_at) SELECT ?, ?, id, title, ?, ?, NULL FROM book WHERE id = ?",
+                [(client_id, username, issued_at, due_date, b) for b in book_ids],
+            )
+            cur.execute(f"SELECT book_pk, loan_id FROM loans WHERE book_pk IN ({_placeholders(book_ids)}) AND returned_at IS NULL", book_ids)
+            loan_ids = dict(cur.fetchall())
+            return [loan_ids[b] for b in book_ids]
+
+    def return_loan(self, loan_id, returned_at):
+        """Close one open loan. See return_many."""
+        self.return_many([loan_id], returned_at)
+
+    def return_many(self, loan_ids, returned_at):
+        """Close open loans, freezing their fines, and shelve their books, as one transaction.
+
+        Either every loan is closed or none is: LoanNotOpen lists any that are
+        unknown or were already returned.
+        """
+        loan_ids = list(dict.fromkeys(loan_ids))
+        if not loan_ids:
+            return
+        with self._immediate() as cur:
+            cur.execute(f"SELECT loan_id FROM loans WHERE loan_id IN ({_placeholders(loan_ids)}) AND returned_at IS NULL", loan_ids)
+            open_ids = {r[0] for r in cur.fetchall()}
+            if len(open_ids) != len(loan_ids):
+                raise LoanNotOpen([i for i in loan_ids if i not in open_ids])
+            cur.executemany(
+                f"UPDATE loans SET returned_at = :at, fine = {FINE_SQL} WHERE loan_id = :loan_id AND returned_at IS NULL",
+                [{'at': returned_at, 'loan_id': i} for i in loan_ids],
+            )
+            cur.executemany(
+                "UPDATE book SET status = 'available' WHERE id = (SELECT book_pk FROM loans WHERE loan_id = ?) AND status = 'checked out'",
+                [(i,) for i in loan_ids],
+            )
+
+    def issue_summary(self, now_iso):
+        """Clients with open loans, their overdue count and fine so far, most loans first.
+
+        Counts come from loan_counts; fines are priced here from the overdue
+        loans only (a range on idx_loans_open_due), so nothing is rewritten.
+        """
+        self.advance_overdue(now_iso)
+        fines = dict(self._fetchall(
+            f"""
+            SELECT {_client_key_sql('loans')}, SUM({FINE_SQL}) FROM loans
+            WHERE returned_at IS NULL AND due_date < :at GROUP BY 1
+            """,
+            {'at': now_iso},
+        ))
+        rows = self._fetchall(
+            "SELECT client_key, client_id, client_username, outstanding, overdue FROM loan_counts WHERE outstanding > 0 ORDER BY outstanding DESC"
+        )
+        return [
+            {
+                'client_id': r['client_id'],
+                'client_username': r['client_username'],
+                'issued_count': r['outstanding'],
+                'overdue_count': r['overdue'],
+                'fine': fines.get(r['client_key'], 0),
+            }
+            for r in rows
+        ]
@@ -0,0 +1,110 @@
+"""Qt item models for Rack-Track's tables.
+
+PagedTableModel only holds the rows the view has scrolled to. It asks a
+repo's page() method for the next keyset page through canFetchMore/fetchMore,
+so opening a tab over a large table costs one page instead of the whole table.
+PagedListModel does the same for rows rendered as formatted text.
+"""
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from db import PAGE_SIZE
+
+
+class PagedTableModel(QAbstractTableModel):
+    """Read-only table fed page by page from fetch_page(after, limit) -> (rows, next_after)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._columns = []
+        self._rows = []
+        self._fetch_page = None
+        self._after = None
+        self._exhausted = True
+
+    def load(self, columns, fetch_page):
+        """Replace the contents with the first page of a new query."""
+        self.populate(columns, fetch_page, fetch_page(None, PAGE_SIZE))
+
+    def populate(self, columns, fetch_page, first_page):
+        """Like load(), with the first (rows, next_after) page already fetched (e.g. on a worker thread)."""
+        self.beginResetModel()
+        self._columns = list(columns)
+        self._fetch_page = fetch_page
+        self._rows, self._after = first_page
+        self._exhausted = self._after is None
+        self.endResetModel()
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self._fetch_page = None
+        self._exhausted = True
+        self.endResetModel()
+
+    def _next_page(self):
+        rows, self._after = self._fetch_page(self._after, PAGE_SIZE)
+        self._exhausted = self._after is None
+        return rows
+
+    def columns(self):
+        return list(self._columns)
+
+    def value(self, row, col):
+        """Raw DB value at (row, col); col may be an index or a column name."""
+        if isinstance(col, str):
+            col = self._columns.index(col)
+        return self._rows[row][col]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        val = self._rows[index.row()][index.column()]
+        return str(val) if val is not None else ''
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section].upper() if section < len(self._columns) else None
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        rows = self._next_page()
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+
+class PagedListModel(PagedTableModel):
+    """Single-column variant for a QListView; formatter(row_dict) renders each row."""
+
+    def __init__(self, formatter, parent=None):
+        super().__init__(parent)
+        self._formatter = formatter
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return self._formatter(dict(zip(self._columns, self._rows[index.row()])))
+
+
+def selected_rows(view):
+    """Sorted row numbers of the rows selected in a QTableView."""
+    return sorted(index.row() for index in view.selectionModel().selectedRows())
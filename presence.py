@@ -0,0 +1,185 @@
+"""Missing-book detection from shelf-reader telemetry.
+
+Every tagged book on a shelf is read over and over by the shelf readers
+(see telemetry.py). PresenceDetector keeps the last WINDOW_S seconds of
+readings in NumPy arrays, topping them up from the append-only readings
+table by rowid, and works out per book:
+
+- last seen: newest reading of its tag
+- rolling signal: mean RSSI over the last ROLLING_S seconds
+- verdict: Present once seen recently with a mean at or above PRESENT_RSSI,
+  Missing once unseen for MISSING_AFTER_S or with a mean below MISSING_RSSI.
+  Anything between keeps the previous verdict (hysteresis), so a tag near
+  the edge of a reader's range doesn't flip the book back and forth.
+
+Verdicts become book.status ('available' <-> 'lost') in one batched update;
+checked-out books are left alone. "Now" is the newest reading, not the wall
+clock: if the readers go quiet, nothing is declared missing. Only books whose
+tag has been read at least once (it has a row in reading_tags) can be marked
+lost. A book no reader has ever seen (a shelf without a reader, an untagged
+copy) keeps its status.
+
+The first pass loads the whole window: each column in one query, as
+numbers NumPy parses without a Python object per reading, which takes about
+half a second for a million readings. Later passes only read the rows that
+arrived since, so a detector kept running with --every is cheap.
+
+    python presence.py               # one detection pass over the current window
+    python presence.py --every 30    # keep running, a pass every 30 seconds
+"""
+import argparse
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from db import DB_PATH, apply_storage_profile
+from telemetry import ensure_readings_table
+
+# seconds of readings kept in memory
+WINDOW_S = 600
+ROLLING_S = 60
+MISSING_AFTER_S = 300
+# hysteresis band on the rolling mean, in dBm
+PRESENT_RSSI = -70
+MISSING_RSSI = -80
+
+_EMPTY = np.empty(0)
+
+
+def verdicts(ts, rssi, book_idx, n_books, as_of, was_present):
+    """Present/Missing per book from readings arrays; the vectorized core of detection.
+
+    ts, rssi, book_idx: one entry per reading (book_idx in range(n_books)).
+    was_present: bool array of the current verdicts. Returns (present,
+    last_seen, mean_rssi) arrays of length n_books; last_seen is -inf and
+    mean_rssi NaN for books without readings.
+    """
+    last_seen = np.full(n_books, -np.inf)
+    np.maximum.at(last_seen, book_idx, ts)
+    recent = ts >= as_of - ROLLING_S
+    counts = np.bincount(book_idx[recent], minlength=n_books)
+    sums = np.bincount(book_idx[recent], weights=rssi[recent], minlength=n_books)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_rssi = sums / counts
+    has_mean = counts > 0
+    seen = last_seen >= as_of - MISSING_AFTER_S
+    now_present = seen & has_mean & (mean_rssi >= PRESENT_RSSI)
+    now_missing = ~seen | (has_mean & (mean_rssi < MISSING_RSSI))
+    present = np.where(now_present, True, np.where(now_missing, False, was_present))
+    return present, last_seen, mean_rssi
+
+
+class PresenceDetector:
+    """Sliding window of readings plus the status pass that turns them into book.status."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # book_code -> reading_tags id, which is also the book's slot in the verdict arrays
+        self.codes = {}
+        self.max_tag = 0
+        self.ts = _EMPTY
+        self.rssi = _EMPTY
+        self.book_idx = np.empty(0, dtype=np.int64)
+        self.last_rowid = 0
+
+    def refresh(self):
+        """Append readings that arrived since the last call and drop those older than WINDOW_S."""
+        if self.last_rowid == 0:
+            # first pass: skip straight to the window instead of reading the whole history
+            row = self.conn.execute("SELECT MAX(ts) FROM readings").fetchone()
+            if row[0] is None:
+                return 0
+            start = self.conn.execute(
+                "SELECT IFNULL(MIN(rowid), 1) - 1 FROM readings WHERE ts >= ?", (row[0] - WINDOW_S,)
+            ).fetchone()[0]
+            self.last_rowid = start
+        high = self.conn.execute("SELECT MAX(rowid) FROM readings").fetchone()[0]
+        if high is None or high <= self.last_rowid:
+            return 0
+        # each column comes back as one string of numbers that NumPy parses in C, instead of a Python
+        # tuple per reading; ts travels as whole microseconds, which format faster than REALs
+        n, ts, rssi, tag = self.conn.execute(
+            "SELECT COUNT(*), group_concat(CAST(ts * 1000000 AS INTEGER), ' '), group_concat(rssi, ' '), group_concat(tag, ' ') "
+            "FROM readings WHERE rowid > ? AND rowid <= ?",
+            (self.last_rowid, high),
+        ).fetchone()
+        self.last_rowid = high
+        # tags are numbered in the transaction that first writes them, so every tag read above is here
+        for code, tag_id in self.conn.execute("SELECT book_code, id FROM reading_tags WHERE id > ?", (self.max_tag,)):
+            self.codes[code] = tag_id
+            self.max_tag = max(self.max_tag, tag_id)
+        if not n:
+            return 0
+        self.ts = np.concatenate([self.ts, np.fromstring(ts, dtype=np.int64, sep=' ') / 1e6])
+        self.rssi = np.concatenate([self.rssi, np.fromstring(rssi, sep=' ')])
+        self.book_idx = np.concatenate([self.book_idx, np.fromstring(tag, dtype=np.int64, sep=' ')])
+        keep = self.ts >= self.ts.max() - WINDOW_S
+        if not keep.all():
+            self.ts, self.rssi, self.book_idx = self.ts[keep], self.rssi[keep], self.book_idx[keep]
+        return n
+
+    def detect(self):
+        """Run one pass; returns {'lost': n, 'available': n} books whose status was changed."""
+        self.refresh()
+        if not len(self.ts):
+            return {'lost': 0, 'available': 0}
+        # books whose tag was never read are left alone: no reader may cover their shelf
+        shelf = [
+            b for b in self.conn.execute(
+                "SELECT id, book_code, status FROM book WHERE status IN ('available', 'lost') AND book_code IS NOT NULL"
+            )
+            if b[1] in self.codes
+        ]
+        if not shelf:
+            return {'lost': 0, 'available': 0}
+        # readings of tags no book claims don't matter; a seen tag with nothing in the window comes out Missing
+        slot = np.fromiter((self.codes[code] for _, code, _ in shelf), np.int64, len(shelf))
+        n = self.max_tag + 1
+        was = np.zeros(n, dtype=bool)
+        was[slot] = np.array([status == 'available' for _, _, status in shelf])
+        present, _, _ = verdicts(self.ts, self.rssi, self.book_idx, n, self.ts.max(), was)
+        changes = []
+        for (book_id, _, status), p in zip(shelf, present[slot]):
+            if p and status == 'lost':
+                changes.append(('available', book_id, 'lost'))
+            elif not p and status == 'available':
+                changes.append(('lost', book_id, 'available'))
+        if changes:
+            # guarded on the old status, so a checkout in the meantime wins
+            self.conn.executemany("UPDATE book SET status = ? WHERE id = ? AND status = ?", changes)
+            self.conn.commit()
+        return {
+            'lost': sum(1 for c in changes if c[0] == 'lost'),
+            'available': sum(1 for c in changes if c[0] == 'available'),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mark books lost/available from shelf-reader telemetry.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="keep running, one pass every SECONDS on the same window")
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.db)
+    apply_storage_profile(conn)
+    ensure_readings_table(conn)
+    # one detector for the whole run, so passes after the first only read new readings
+    detector = PresenceDetector(conn)
+    try:
+        while True:
+            started = time.perf_counter()
+            changed = detector.detect()
+            print(f"Marked {changed['lost']} books lost and {changed['available']} available in {time.perf_counter() - started:.2f}s.", flush=True)
+            if not args.every:
+                break
+            time.sleep(args.every)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
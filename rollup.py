@@ -0,0 +1,161 @@
+"""Roll shelf-reader readings up into hourly and daily aggregates, and prune old raw rows.
+
+The readings table (see telemetry.py) only ever grows. This job folds raw
+readings into per-book buckets in `readings_hourly` and `readings_daily`
+(count, min/max/sum of RSSI, last timestamp; mean is rssi_sum / n), then
+deletes raw readings older than RAW_RETENTION_S and hourly buckets older
+than HOURLY_RETENTION_S. Daily buckets are kept.
+
+It is incremental: `rollup_state` remembers the highest readings rowid
+already folded in, and each run only reads rows past it. Readings ids are
+AUTOINCREMENT, so a pruned id is never handed out again. Readings arriving
+late (an old timestamp, a new rowid) merge into their existing bucket.
+Rows are only ever deleted once they are behind the watermark, so nothing
+is pruned before it has been counted. Every step works in short batches
+with a commit in between, so the ingest writer is never kept waiting long.
+
+    python rollup.py                 # one pass
+    python rollup.py --every 300     # keep running, a pass every five minutes
+"""
+import argparse
+import sqlite3
+import sys
+import time
+
+from db import DB_PATH, apply_storage_profile
+from telemetry import ensure_readings_table
+
+# raw readings folded into the aggregates per transaction
+ROLLUP_BATCH_ROWS = 50000
+# rows deleted per transaction when pruning
+PRUNE_BATCH_ROWS = 5000
+# pause between prune batches so the ingest writer can take the lock
+PRUNE_PAUSE_S = 0.01
+RAW_RETENTION_S = 7 * 86400
+HOURLY_RETENTION_S = 90 * 86400
+
+# bucket start, in epoch seconds (UTC), of each aggregate table
+BUCKETS = {'readings_hourly': 3600, 'readings_daily': 86400}
+
+_BUCKET_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    book_code TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    rssi_min INTEGER NOT NULL,
+    rssi_max INTEGER NOT NULL,
+    rssi_sum INTEGER NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (book_code, bucket)
+) WITHOUT ROWID
+"""
+
+# late readings merge into the bucket that already exists
+_ROLLUP_SQL = """
+INSERT INTO {table} (book_code, bucket, n, rssi_min, rssi_max, rssi_sum, last_ts)
+SELECT book_code, CAST(ts / {size} AS INTEGER) * {size}, COUNT(*), MIN(rssi), MAX(rssi), SUM(rssi), MAX(ts)
+FROM readings WHERE rowid > ? AND rowid <= ?
+GROUP BY 1, 2
+ON CONFLICT (book_code, bucket) DO UPDATE SET
+    n = n + excluded.n,
+    rssi_min = MIN(rssi_min, excluded.rssi_min),
+    rssi_max = MAX(rssi_max, excluded.rssi_max),
+    rssi_sum = rssi_sum + excluded.rssi_sum,
+    last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+
+def ensure_rollup_tables(conn):
+    """Create the aggregate tables and the watermark row."""
+    ensure_readings_table(conn)
+    for table in BUCKETS:
+        conn.execute(_BUCKET_DDL.format(table=table))
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS rollup_state (id INTEGER PRIMARY KEY CHECK (id = 1), rolled_rowid INTEGER NOT NULL)"
+    )
+    conn.execute("INSERT OR IGNORE INTO rollup_state (id, rolled_rowid) VALUES (1, 0)")
+    conn.commit()
+
+
+def watermark(conn):
+    return conn.execute("SELECT rolled_rowid FROM rollup_state WHERE id = 1").fetchone()[0]
+
+
+def roll_up(conn, batch_rows=ROLLUP_BATCH_ROWS):
+    """Fold readings past the watermark into the aggregates; returns the number of readings folded."""
+    high = conn.execute("SELECT MAX(rowid) FROM readings").fetchone()[0] or 0
+    done = watermark(conn)
+    folded = 0
+    while done < high:
+        upto = min(done + batch_rows, high)
+        # rowids can have gaps after pruning, so count what is actually there
+        folded += conn.execute("SELECT COUNT(*) FROM readings WHERE rowid > ? AND rowid <= ?", (done, upto)).fetchone()[0]
+        # aggregates and watermark move together, so a crash never counts a reading twice
+        for table, size in BUCKETS.items():
+            conn.execute(_ROLLUP_SQL.format(table=table, size=size), (done, upto))
+        conn.execute("UPDATE rollup_state SET rolled_rowid = ? WHERE id = 1", (upto,))
+        conn.commit()
+        done = upto
+    return folded
+
+
+def prune(conn, now, raw_retention_s=RAW_RETENTION_S, hourly_retention_s=HOURLY_RETENTION_S,
+          batch_rows=PRUNE_BATCH_ROWS, pause_s=PRUNE_PAUSE_S):
+    """Drop raw readings (already rolled up) and hourly buckets past retention; returns (raw, hourly) deleted."""
+    raw = 0
+    cutoff, rolled = now - raw_retention_s, watermark(conn)
+    while True:
+        cur = conn.execute(
+            "DELETE FROM readings WHERE rowid IN (SELECT rowid FROM readings WHERE ts < ? AND rowid <= ? LIMIT ?)",
+            (cutoff, rolled, batch_rows),
+        )
+        conn.commit()
+        raw += cur.rowcount
+        if cur.rowcount < batch_rows:
+            break
+        time.sleep(pause_s)
+    # WITHOUT ROWID table: delete one bucket (an hour of every book) per transaction
+    hourly = 0
+    cutoff = now - hourly_retention_s
+    while True:
+        row = conn.execute("SELECT MIN(bucket) FROM readings_hourly WHERE bucket < ?", (cutoff,)).fetchone()
+        if row[0] is None:
+            return raw, hourly
+        cur = conn.execute("DELETE FROM readings_hourly WHERE bucket = ?", (row[0],))
+        conn.commit()
+        hourly += cur.rowcount
+        time.sleep(pause_s)
+
+
+def run_once(conn, now=None):
+    """One roll-up and prune pass; returns a dict of what it did."""
+    started = time.perf_counter()
+    folded = roll_up(conn)
+    raw, hourly = prune(conn, time.time() if now is None else now)
+    return dict(folded=folded, raw_pruned=raw, hourly_pruned=hourly, seconds=round(time.perf_counter() - started, 2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roll up and prune shelf-reader readings.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="keep running, one pass every SECONDS")
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.db)
+    apply_storage_profile(conn)
+    ensure_rollup_tables(conn)
+    try:
+        while True:
+            print(" ".join(f"{k}={v}" for k, v in run_once(conn).items()), flush=True)
+            if not args.every:
+                break
+            time.sleep(args.every)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,89 +1,699 @@
+import argparse
 import csv
+import hashlib
 import os
+import queue
 import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "rack-track.db")
-CSV_FILE = os.path.join(os.path.dirname(__file__), "library_dataset_random.csv")
+from db import DB_PATH, LOANS_DDL, apply_storage_profile, ensure_book_fts, ensure_indexes, format_location, migrate, rebuild_loan_counts, reserve_book_ids
+from sqltrace import TracedConnection, stats as sql_stats
+
+CSV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "library_dataset_random.csv")
 # If True the script wipes `book` before importing. Set to False to preserve existing rows.
 REPLACE_BOOKS = True
+# rows per executemany/transaction while importing
+IMPORT_BATCH_ROWS = 10000
+# page cache for the import, in KiB (negative cache_size)
+IMPORT_CACHE_KIB = -200000
+# parallel import (--workers N): bytes of CSV per parse task, parsed chunks queued for the writer
+IMPORT_CHUNK_BYTES = 8 * 1024 * 1024
+IMPORT_QUEUE_CHUNKS = 4
+# books without a usable ISBN get PSEUDO_ISBN_BASE + their row number in the CSV
+PSEUDO_ISBN_BASE = 10**12
+# the dataset's Status column, in the app's status vocabulary; a blank status means on the shelf.
+# 'checked out' is reserved for books with an open loan in `loans`, which the dataset's checkouts
+# don't have: they come in as 'out at import', outside circulation, until an admin sets them
+# 'available' (or 'lost') once the copy is accounted for
+SOURCE_STATUS = {
+    '': 'available',
+    'present': 'available',
+    'available': 'available',
+    'missing': 'lost',
+    'lost': 'lost',
+    'checked out': 'out at import',
+}
 
 
 def ensure_tables(conn):
     cur = conn.cursor()
     cur.execute("CREATE TABLE IF NOT EXISTS client (client_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, password TEXT, email TEXT UNIQUE);")
     cur.execute("CREATE TABLE IF NOT EXISTS admin (admin_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, password TEXT, email TEXT UNIQUE);")
-    cur.execute("CREATE TABLE IF NOT EXISTS book (title TEXT, author TEXT, status TEXT, rack_column_row TEXT, year INTEGER, isbn INTEGER PRIMARY KEY);")
-    cur.execute("CREATE TABLE IF NOT EXISTS loans (loan_id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, client_username TEXT, book_pk TEXT, book_title TEXT, issued_at TEXT, due_date TEXT, returned_at TEXT, fine INTEGER);")
+    cur.execute("CREATE TABLE IF NOT EXISTS book (title TEXT, author TEXT, status TEXT, rack_column_row TEXT, year INTEGER, isbn INTEGER PRIMARY KEY, book_code TEXT, category TEXT, cabinet INTEGER, rack INTEGER, shelf_row INTEGER);")
+    cur.execute(LOANS_DDL)
+    # what `setup.py --delta` last imported: the feed's key for each book and a hash of its catalogue values
+    cur.execute("CREATE TABLE IF NOT EXISTS book_import (source_key TEXT PRIMARY KEY, book_id INTEGER NOT NULL, row_hash BLOB NOT NULL) WITHOUT ROWID;")
     # basic seeds
     cur.execute("INSERT OR IGNORE INTO admin (admin_id, username, password, email) VALUES (?,?,?,?);", (1, 'admin', 'admin', 'admin@gmail.com'))
     cur.execute("INSERT OR IGNORE INTO client (client_id, username, password, email) VALUES (?,?,?,?);", (1, 'a', 'a', 'a@gmail.com'))
     conn.commit()
 
 
-def import_csv(conn, csv_path):
+def _int_or_none(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_row(row):
+    """Book values from one CSV row, in _BookLoader.COLUMNS order with isbn possibly None.
+
+    A ValueError says why the row is rejected.
+    """
+    title = (row.get('title') or row.get('Title') or '')[:255]
+    if not title.strip():
+        raise ValueError("no title")
+    author = (row.get('author') or row.get('Author') or '')[:255]
+    year = _int_or_none(row.get('year') or row.get('Year'))
+    isbn = _int_or_none(row.get('isbn') or row.get('ISBN'))
+    source_status = (row.get('status') or row.get('Status') or '').strip()
+    status = SOURCE_STATUS.get(source_status.lower())
+    if status is None:
+        raise ValueError(f"unknown status {source_status!r}")
+    # a location is kept only when all three parts are numbers
+    location = tuple(_int_or_none(row.get(c) or row.get(c.lower())) for c in ('Cabinet', 'Rack', 'Row'))
+    if None in location:
+        location = (None, None, None)
+    book_code = (row.get('Book_ID') or row.get('book_id') or '').strip() or None
+    category = (row.get('Category') or row.get('category') or '').strip() or None
+    return (title, author, status, format_location(*location), year, isbn or None, book_code, category) + location
+
+
+def _parse_records(records, fieldnames):
+    """Parse raw CSV records (lists of strings) into (count, books, rejects).
+
+    books holds (n, record) + _parse_row(...) and rejects holds
+    (n, reason, record), n being the record's position in `records`. The
+    raw record travels with each book, so a row rejected later, at insert
+    time, is written to the reject file as the CSV had it. Blank
+    lines are skipped without being counted, as csv.DictReader does.
+    Runs in the import worker processes, so it must not touch the database.
+    """
+    books, rejects = [], []
+    n = 0
+    for record in records:
+        if not record:
+            continue
+        if len(record) != len(fieldnames):
+            rejects.append((n, "wrong number of fields", record))
+        else:
+            try:
+                books.append((n, record) + _parse_row(dict(zip(fieldnames, record))))
+            except ValueError as e:
+                rejects.append((n, str(e), record))
+        n += 1
+    return n, books, rejects
+
+
+def _source_key(params):
+    """The feed's key for a parsed row (_parse_row order): its Book_ID, else its ISBN, else None."""
+    if params[6]:
+        return 'code:' + params[6]
+    return 'isbn:' + str(params[5]) if params[5] else None
+
+
+def _row_hash(params):
+    """Digest of a parsed row's catalogue values; status is circulation state and is left out."""
+    catalogue = params[:2] + params[3:]
+    return hashlib.blake2b(repr(list(catalogue)).encode(), digest_size=16).digest()
+
+
+@contextmanager
+def _import_pragmas(conn):
+    """Trade durability for speed while loading; a crashed import is simply re-run."""
+    saved = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in ('journal_mode', 'synchronous', 'cache_size')}
+    if saved['journal_mode'] == 'wal':
+        # leaving WAL needs every other connection closed; desks may be running, so stay in it
+        del saved['journal_mode']
+    else:
+        conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(f"PRAGMA cache_size = {IMPORT_CACHE_KIB}")
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+
+def _wipe_books(conn):
+    """Empty `book` and book_import for replace=True, committed before anything is loaded.
+
+    Committed on its own so a rollback while loading can't bring the old
+    books back under the ids the load is handing out.
+    """
+    conn.execute("DELETE FROM book")
+    conn.execute("DELETE FROM book_import")
+    conn.commit()
+
+
+@contextmanager
+def _deferred_book_indexes(conn):
+    """Drop book's secondary indexes and FTS triggers for the load, then rebuild them once.
+
+    Maintaining every index (and the full-text index) row by row is what
+    makes a bulk load slow; building each once over the loaded table is not.
+    UNIQUE indexes stay in place, so the load itself rejects duplicates and
+    the rebuild can't fail on them. Every dropped index and trigger is
+    recreated even if one of them fails; the failures are raised afterwards.
+    """
+    saved = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'book' AND sql IS NOT NULL "
+        "AND ((type = 'index' AND sql NOT LIKE 'CREATE UNIQUE %') OR (type = 'trigger' AND name LIKE 'book_fts_%'))"
+    ).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+    conn.commit()
+    try:
+        yield
+    finally:
+        # a failed batch must not be committed along with the rebuild
+        conn.rollback()
+        started = time.perf_counter()
+        failed = []
+        for _, name, sql in saved:
+            try:
+                conn.execute(sql)
+            except sqlite3.Error as e:
+                failed.append(f"{name}: {e}")
+        if any(name.startswith('book_fts_') for _, name, _ in saved):
+            try:
+                conn.execute("INSERT INTO book_fts(book_fts) VALUES ('rebuild')")
+            except sqlite3.Error as e:
+                failed.append(f"book_fts rebuild: {e}")
+        conn.commit()
+        print(f"Rebuilt {len(saved) - len(failed)} book indexes/triggers in {time.perf_counter() - started:.1f}s.")
+        if failed:
+            raise sqlite3.DatabaseError("could not rebuild " + "; ".join(failed))
+
+
+class _BookLoader:
+    """Writes parsed batches into `book`, in order, on the connection it was given.
+
+    Parsed rows are numbered here, across batches, so pseudo-ISBNs and book
+    ids come out the same however the file was split for parsing. A Book_ID
+    that an earlier row or an existing book already has is rejected, as
+    `--delta` does.
+    """
+
+    COLUMNS = ['title', 'author', 'status', 'rack_column_row', 'year', 'isbn', 'book_code', 'category', 'cabinet', 'rack', 'shelf_row']
+    ISBN = COLUMNS.index('isbn')
+    CODE = COLUMNS.index('book_code')
+
+    def __init__(self, conn, rejects, batch_rows):
+        """conn's database must be at the current schema version (see db.migrate)."""
+        self.conn = conn
+        self.rejects = rejects
+        self.batch_rows = batch_rows
+        # give books their id here, from one book_id_seq reservation per batch rather than a trigger per row
+        self.insert_sql = f"INSERT OR IGNORE INTO book ({', '.join(self.COLUMNS)}, id) VALUES ({', '.join('?' * (len(self.COLUMNS) + 1))})"
+        self.track_sql = "INSERT OR IGNORE INTO book_import (source_key, book_id, row_hash) VALUES (?,?,?)"
+        self.codes = set()
+        self.read = self.inserted = self.rejected = 0
+        self.started = time.perf_counter()
+
+    def load(self, count, books, rejects):
+        """Insert one parsed chunk (see _parse_records), batch_rows rows per transaction."""
+        base = self.read
+        for n, reason, record in rejects:
+            self.rejects.writerow([base + n + 1, reason] + record)
+        self.rejected += len(rejects)
+        for start in range(0, len(books), self.batch_rows):
+            batch = books[start:start + self.batch_rows]
+            stored = self._stored_codes([book[2 + self.CODE] for book in batch if book[2 + self.CODE]])
+            values = []
+            for book in batch:
+                n, record, params = book[0], book[1], list(book[2:])
+                code = params[self.CODE]
+                if code:
+                    if code in self.codes or code in stored:
+                        self.rejects.writerow([base + n + 1, f"duplicate Book_ID {code}"] + record)
+                        self.rejected += 1
+                        continue
+                    self.codes.add(code)
+                # recorded for `setup.py --delta`, from the row as the feed has it
+                key = _source_key(params)
+                track = [key, None, _row_hash(params)] if key else None
+                # fallback pseudo-isbn, numbered by the row's place in the file
+                params[self.ISBN] = params[self.ISBN] or PSEUDO_ISBN_BASE + base + n
+                params.append(None)
+                values.append((base + n, params, track, record))
+            self._insert(values)
+        self.read += count
+        elapsed = time.perf_counter() - self.started
+        print(f"  {self.read} rows read, {self.inserted} inserted, {self.rejected} rejected ({self.read / elapsed:.0f} rows/s)")
+
+    def _stored_codes(self, codes):
+        """The Book_IDs among codes that books already in the table have (lookups on idx_book_code)."""
+        found = set()
+        for start in range(0, len(codes), 500):
+            chunk = codes[start:start + 500]
+            found.update(r[0] for r in self.conn.execute(
+                f"SELECT book_code FROM book WHERE book_code IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        return found
+
+    def _number(self, values):
+        """Give each row of a batch its id, reserved in the batch's transaction."""
+        book_id = reserve_book_ids(self.conn, len(values))
+        for _, params, track, _ in values:
+            params[-1] = book_id
+            if track:
+                track[1] = book_id
+            book_id += 1
+
+    def _insert(self, values):
+        try:
+            self._number(values)
+            inserted = self.conn.executemany(self.insert_sql, [v[1] for v in values]).rowcount
+            if inserted < len(values):
+                # some rows were already there; only the ones actually inserted may be tracked
+                raise sqlite3.IntegrityError("duplicate isbn in batch")
+            self.conn.executemany(self.track_sql, [v[2] for v in values if v[2]])
+            self.inserted += inserted
+        except sqlite3.Error:
+            # find the offending rows one at a time, keep the rest of the batch
+            self.conn.rollback()
+            # the rollback gave the batch's ids back; ids of rows rejected below are simply never used
+            self._number(values)
+            for i, params, track, record in values:
+                try:
+                    if self.conn.execute(self.insert_sql, params).rowcount:
+                        self.inserted += 1
+                        if track:
+                            self.conn.execute(self.track_sql, track)
+                    else:
+                        # INSERT OR IGNORE skipped it: an earlier row or an existing book has its isbn
+                        self.rejects.writerow([i + 1, "duplicate isbn"] + record)
+                        self.rejected += 1
+                except sqlite3.Error as e:
+                    self.rejects.writerow([i + 1, e] + record)
+                    self.rejected += 1
+        self.conn.commit()
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _byte_ranges(csv_path, data_start, chunk_bytes):
+    size = os.path.getsize(csv_path)
+    return [(start, min(start + chunk_bytes, size)) for start in range(data_start, size, chunk_bytes)]
+
+
+def _parse_byte_range(csv_path, start, end, data_start, fieldnames):
+    """Worker: parse the lines that begin inside [start, end) of csv_path.
+
+    A line straddling `start` belongs to the previous range, so every line
+    is parsed exactly once. Quoted fields must not contain newlines.
+    """
+    with open(csv_path, 'rb') as fh:
+        if start > data_start:
+            # finish the line the previous range started
+            fh.seek(start - 1)
+            fh.readline()
+        else:
+            fh.seek(start)
+        lines = []
+        while fh.tell() < end:
+            line = fh.readline()
+            if not line:
+                break
+            lines.append(line.decode('utf-8'))
+    return _parse_records(csv.reader(lines), fieldnames)
+
+
+def _parallel_chunks(csv_path, workers, chunk_bytes):
+    """Parsed chunks of csv_path in file order, parsed by a pool of `workers` processes.
+
+    At most 2 * workers chunks are in flight, so a slow writer holds back
+    the parsers instead of letting parsed rows pile up in memory.
+    """
+    with open(csv_path, 'rb') as fh:
+        fieldnames = next(csv.reader([fh.readline().decode('utf-8-sig')]))
+        data_start = fh.tell()
+    ranges = iter(_byte_ranges(csv_path, data_start, chunk_bytes))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_parse_byte_range, csv_path, start, end, data_start, fieldnames))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _writer(conn, loader_args, replace, chunks, result):
+    """Writer thread: the only user of conn while a parallel import runs."""
+    ended = False
+    try:
+        with _import_pragmas(conn), _deferred_book_indexes(conn):
+            if replace:
+                _wipe_books(conn)
+            loader = _BookLoader(conn, *loader_args)
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    ended = True
+                    break
+                loader.load(*chunk)
+        # only once the indexes are rebuilt: a failure there must reach the caller
+        result.append(loader)
+    except BaseException as e:
+        result.append(e)
+        # keep draining up to the end marker, so the parser side never blocks on a full queue;
+        # if the failure came after it (e.g. in the index rebuild) there is nothing left to wait for
+        while not ended:
+            ended = chunks.get() is None
+
+
+def import_csv(conn, csv_path, replace=False, batch_rows=IMPORT_BATCH_ROWS, reject_path=None, workers=1):
+    """Stream csv_path into `book`, batch_rows rows per executemany and transaction.
+
+    Rows that can't be parsed or inserted are written, with the reason, to
+    reject_path (default: <csv>.rejects.csv) instead of being dropped.
+    Books already present (same isbn) are skipped and go to the reject file
+    too. replace=True empties `book` first, in its own transaction. Returns
+    the number of books inserted.
+
+    With workers > 1, byte ranges of the file are parsed by that many
+    processes and a single writer thread loads them through a bounded queue;
+    conn must then be opened with check_same_thread=False. The result is
+    the same as a serial import, but quoted fields must not span lines.
+    """
     if not os.path.exists(csv_path):
+        if replace:
+            _wipe_books(conn)
         print("CSV not found; skipping import.")
         return 0
-    cur = conn.cursor()
-    inserted = 0
-    with open(csv_path, newline='', encoding='utf-8') as fh:
-        reader = csv.DictReader(fh)
-        for i, row in enumerate(reader):
-            title = (row.get('title') or row.get('Title') or '')[:255]
-            author = (row.get('author') or row.get('Author') or '')[:255]
-            year = row.get('year') or row.get('Year') or None
-            try:
-                year = int(year) if year else None
-            except Exception:
-                year = None
-            isbn = row.get('isbn') or row.get('ISBN')
-            try:
-                isbn = int(isbn) if isbn else None
-            except Exception:
-                isbn = None
-            if not isbn:
-                # fallback pseudo-isbn
-                isbn = 10**12 + i
+    reject_path = reject_path or os.path.splitext(csv_path)[0] + ".rejects.csv"
+    started = time.perf_counter()
+    with open(csv_path, newline='', encoding='utf-8-sig') as fh, open(reject_path, 'w', newline='', encoding='utf-8') as rej_fh:
+        reader = csv.reader(fh)
+        fieldnames = next(reader, [])
+        rejects = csv.writer(rej_fh)
+        rejects.writerow(['row', 'reason'] + fieldnames)
+        if workers > 1:
+            chunks = queue.Queue(maxsize=IMPORT_QUEUE_CHUNKS)
+            result = []
+            writer = threading.Thread(target=_writer, args=(conn, (rejects, batch_rows), replace, chunks, result))
+            writer.start()
             try:
-                cur.execute(
-                    "INSERT OR IGNORE INTO book (title, author, status, rack_column_row, year, isbn) VALUES (?,?,?,?,?,?);",
-                    (title, author, 'available', '', year, isbn),
-                )
-                if cur.rowcount:
-                    inserted += 1
-            except Exception:
-                continue
-    conn.commit()
-    print(f"Imported {inserted} books from CSV.")
-    return inserted
+                for chunk in _parallel_chunks(csv_path, workers, IMPORT_CHUNK_BYTES):
+                    chunks.put(chunk)
+            finally:
+                chunks.put(None)
+                writer.join()
+            if isinstance(result[0], BaseException):
+                raise result[0]
+            loader = result[0]
+        else:
+            with _import_pragmas(conn), _deferred_book_indexes(conn):
+                if replace:
+                    # with the triggers gone this is a truncate, not a row-by-row delete
+                    _wipe_books(conn)
+                loader = _BookLoader(conn, rejects, batch_rows)
+                for batch in _batches(reader, batch_rows):
+                    loader.load(*_parse_records(batch, fieldnames))
+    if loader.rejected:
+        print(f"Rejected rows written to {reject_path}.")
+    else:
+        os.remove(reject_path)
+    print(f"Imported {loader.inserted} books from CSV in {time.perf_counter() - started:.1f}s.")
+    return loader.inserted
 
 
-def ensure_book_id(conn):
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(book);")
-    cols = [r[1] for r in cur.fetchall()]
-    if 'id' not in cols:
+class _BookSyncer:
+    """Applies one parsed chunk of the feed as inserts and updates against what book_import recorded.
+
+    A book's key in the feed is its Book_ID, or its ISBN when it has none.
+    Status is circulation state owned by the app (checkouts, returns,
+    presence detection), so it is taken from the feed for new books only and
+    is left out of the row hash. Books the feed no longer lists are removed
+    afterwards by delete_missing().
+    """
+
+    COLUMNS = _BookLoader.COLUMNS
+    ISBN = COLUMNS.index('isbn')
+    CODE = COLUMNS.index('book_code')
+    STATUS = COLUMNS.index('status')
+    # catalogue columns an update rewrites; isbn only when the feed has one, since it is the rowid
+    UPDATE_COLUMNS = [c for c in COLUMNS if c not in ('status', 'isbn')]
+
+    def __init__(self, conn, rejects, batch_rows):
+        self.conn = conn
+        self.rejects = rejects
+        self.batch_rows = batch_rows
+        self.insert_sql = f"INSERT INTO book ({', '.join(self.COLUMNS)}, id) VALUES ({', '.join('?' * (len(self.COLUMNS) + 1))})"
+        self.update_sql = f"UPDATE book SET {', '.join(c + ' = ?' for c in self.UPDATE_COLUMNS)}, isbn = IFNULL(?, isbn) WHERE id = ?"
+        self.track_sql = "INSERT OR REPLACE INTO book_import (source_key, book_id, row_hash) VALUES (?,?,?)"
+        self.seen = set()
+        self.read = self.inserted = self.updated = self.unchanged = self.rejected = 0
+        self.deleted = self.kept_on_loan = 0
+        self.started = time.perf_counter()
+
+    def load(self, count, books, rejects):
+        base = self.read
+        for n, reason, record in rejects:
+            self.rejects.writerow([base + n + 1, reason] + record)
+        self.rejected += len(rejects)
+        for start in range(0, len(books), self.batch_rows):
+            self._apply(base, books[start:start + self.batch_rows])
+        self.read += count
+        elapsed = time.perf_counter() - self.started
+        print(f"  {self.read} rows read: {self.inserted} new, {self.updated} changed, {self.unchanged} unchanged, "
+              f"{self.rejected} rejected ({self.read / elapsed:.0f} rows/s)")
+
+    def _apply(self, base, books):
+        """Diff one batch against the stored hashes and write the difference in one transaction."""
+        rows = []
+        for book in books:
+            n, record, params = base + book[0], book[1], list(book[2:])
+            key = _source_key(params)
+            if key is None:
+                self._reject(n, "no Book_ID or ISBN to match on", record)
+            elif key in self.seen:
+                self._reject(n, f"duplicate {key}", record)
+            else:
+                self.seen.add(key)
+                rows.append((n, key, params, _row_hash(params), record))
+        tracked = self._tracked([r[1] for r in rows])
+        untracked = [r for r in rows if r[1] not in tracked]
+        adopted = self._adopt(untracked)
+        writes = []
+        for n, key, params, digest, record in rows:
+            if key in tracked:
+                book_id, old = tracked[key]
+                if old == digest:
+                    self.unchanged += 1
+                    continue
+                writes.append((n, 'updated', self._update_params(params, book_id), (key, book_id, digest), record))
+            elif key in adopted:
+                book_id, same = adopted[key]
+                if same:
+                    writes.append((n, 'adopted', [], (key, book_id, digest), record))
+                    continue
+                writes.append((n, 'updated', self._update_params(params, book_id), (key, book_id, digest), record))
+            else:
+                writes.append((n, 'inserted', params + [None], [key, None, digest], record))
         try:
-            cur.execute("ALTER TABLE book ADD COLUMN id INTEGER;")
-            cur.execute("UPDATE book SET id = rowid WHERE id IS NULL;")
-            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_book_id ON book(id);")
-            conn.commit()
-        except Exception:
-            pass
+            self._number(writes)
+            self._write(writes)
+        except sqlite3.Error:
+            # find the offending rows one at a time, keep the rest of the batch
+            self.conn.rollback()
+            # the rollback gave the new books' ids back
+            self._number(writes)
+            for write in writes:
+                try:
+                    self._write([write])
+                except sqlite3.Error as e:
+                    self._reject(write[0], e, write[4])
+        self.conn.commit()
+
+    def _number(self, writes):
+        """Give the batch's new books their ids, reserved in the batch's transaction."""
+        inserts = [w for w in writes if w[1] == 'inserted']
+        book_id = reserve_book_ids(self.conn, len(inserts))
+        for w in inserts:
+            w[2][-1] = w[3][1] = book_id
+            book_id += 1
+
+    def _write(self, writes):
+        inserts = [w for w in writes if w[1] == 'inserted']
+        updates = [w for w in writes if w[1] == 'updated']
+        self.conn.executemany(self.insert_sql, [w[2] for w in inserts])
+        self.conn.executemany(self.update_sql, [w[2] for w in updates])
+        self.conn.executemany(self.track_sql, [w[3] for w in writes])
+        self.inserted += len(inserts)
+        self.updated += len(updates)
+        self.unchanged += len(writes) - len(inserts) - len(updates)
+
+    def _update_params(self, params, book_id):
+        values = dict(zip(self.COLUMNS, params))
+        return [values[c] for c in self.UPDATE_COLUMNS] + [params[self.ISBN], book_id]
+
+    def _reject(self, n, reason, record):
+        self.rejects.writerow([n + 1, reason] + record)
+        self.rejected += 1
+
+    def _tracked(self, keys):
+        """{key: (book_id, row_hash)} for the keys book_import knows."""
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            found.update(
+                (key, (book_id, digest)) for key, book_id, digest in self.conn.execute(
+                    f"SELECT source_key, book_id, row_hash FROM book_import WHERE source_key IN ({', '.join('?' * len(chunk))})", chunk
+                )
+            )
+        return found
+
+    def _adopt(self, rows):
+        """Match feed rows book_import doesn't know to books already in the table.
+
+        Returns {key: (book_id, unchanged)}. Databases imported before
+        book_import existed get their books adopted this way on the first
+        sync instead of re-inserted; those the feed has already dropped are
+        not tracked, so that first sync can't delete them.
+        """
+        adopted = {}
+        cols = ', '.join(['id'] + self.COLUMNS)
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            codes = [r[2][self.CODE] for r in chunk if r[2][self.CODE]]
+            isbns = [r[2][self.ISBN] for r in chunk if not r[2][self.CODE]]
+            stored = {}
+            if codes:
+                for row in self.conn.execute(f"SELECT {cols} FROM book WHERE book_code IN ({', '.join('?' * len(codes))})", codes):
+                    stored.setdefault('code:' + row[1 + self.CODE], row)
+            if isbns:
+                for row in self.conn.execute(f"SELECT {cols} FROM book WHERE isbn IN ({', '.join('?' * len(isbns))})", isbns):
+                    stored.setdefault('isbn:' + str(row[1 + self.ISBN]), row)
+            for _, key, params, _, _ in chunk:
+                row = stored.get(key)
+                if row is None:
+                    continue
+                current = list(row[1:])
+                # a feed row without an ISBN matches whatever (pseudo-)ISBN the book was given
+                if params[self.ISBN] is None:
+                    current[self.ISBN] = None
+                current[self.STATUS] = params[self.STATUS]
+                adopted[key] = (row[0], current == params)
+        return adopted
+
+    def delete_missing(self):
+        """Remove the books book_import tracks that the feed no longer lists; books on loan stay."""
+        gone = [(key, book_id) for key, book_id in self.conn.execute("SELECT source_key, book_id FROM book_import") if key not in self.seen]
+        for start in range(0, len(gone), self.batch_rows):
+            batch = gone[start:start + self.batch_rows]
+            on_loan = set()
+            for part in range(0, len(batch), 500):
+                ids = [book_id for _, book_id in batch[part:part + 500]]
+                on_loan.update(r[0] for r in self.conn.execute(
+                    f"SELECT book_pk FROM loans WHERE book_pk IN ({', '.join('?' * len(ids))}) AND returned_at IS NULL", ids
+                ))
+            removable = [(key, book_id) for key, book_id in batch if book_id not in on_loan]
+            self.conn.executemany("DELETE FROM book WHERE id = ?", [(book_id,) for _, book_id in removable])
+            self.conn.executemany("DELETE FROM book_import WHERE source_key = ?", [(key,) for key, _ in removable])
+            self.conn.commit()
+            self.deleted += len(removable)
+            self.kept_on_loan += len(batch) - len(removable)
+
+
+def sync_csv(conn, csv_path, batch_rows=IMPORT_BATCH_ROWS, reject_path=None, workers=1):
+    """Bring `book` in line with csv_path by applying only what changed since the last sync.
+
+    Each row is hashed and compared with the hash book_import stored for its
+    key (Book_ID, else ISBN): new keys are inserted, changed rows updated,
+    and tracked books missing from the file deleted, batch_rows per
+    transaction with the indexes and full-text triggers left in place.
+    Statuses of existing books are never touched, and a book that is out on
+    loan is not deleted until it comes back. Unusable rows go to
+    reject_path as in import_csv. Returns a dict of change counts.
+
+    Parsing and hashing the whole file is most of the work when little has
+    changed, so workers > 1 parses it in that many processes, as import_csv
+    does; the diff and writes stay on this thread.
+    """
+    if not os.path.exists(csv_path):
+        print("CSV not found; nothing to sync.")
+        return None
+    reject_path = reject_path or os.path.splitext(csv_path)[0] + ".rejects.csv"
+    with open(csv_path, newline='', encoding='utf-8-sig') as fh, open(reject_path, 'w', newline='', encoding='utf-8') as rej_fh:
+        reader = csv.reader(fh)
+        fieldnames = next(reader, [])
+        rejects = csv.writer(rej_fh)
+        rejects.writerow(['row', 'reason'] + fieldnames)
+        syncer = _BookSyncer(conn, rejects, batch_rows)
+        if workers > 1:
+            chunks = _parallel_chunks(csv_path, workers, IMPORT_CHUNK_BYTES)
+        else:
+            chunks = (_parse_records(batch, fieldnames) for batch in _batches(reader, batch_rows))
+        for chunk in chunks:
+            syncer.load(*chunk)
+        syncer.delete_missing()
+    if syncer.rejected:
+        print(f"Rejected rows written to {reject_path}.")
+    else:
+        os.remove(reject_path)
+    counts = dict(
+        inserted=syncer.inserted, updated=syncer.updated, deleted=syncer.deleted, unchanged=syncer.unchanged,
+        kept_on_loan=syncer.kept_on_loan, rejected=syncer.rejected,
+    )
+    print(f"Synced books from CSV in {time.perf_counter() - syncer.started:.1f}s: "
+          + ", ".join(f"{n} {name.replace('_', ' ')}" for name, n in counts.items()) + ".")
+    return counts
 
 
 def main():
-    conn = sqlite3.connect(DB_PATH)
+    parser = argparse.ArgumentParser(description="Create the Rack-Track tables and import the book CSV.")
+    parser.add_argument("--workers", type=int, default=1, help="processes parsing the CSV in parallel (default 1: serial import)")
+    parser.add_argument("--delta", action="store_true", help="apply only the rows that changed since the last import (ignores REPLACE_BOOKS)")
+    parser.add_argument("--sql-stats", metavar="FILE", help="write per-statement SQL timings to FILE as JSON when done")
+    args = parser.parse_args()
+    # the parallel import loads through a writer thread
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, factory=TracedConnection)
     try:
+        apply_storage_profile(conn)
         ensure_tables(conn)
-        if REPLACE_BOOKS:
-            print("REPLACE_BOOKS=True: wiping existing `book` rows.")
-            conn.execute("DELETE FROM book;")
-            conn.commit()
-        import_csv(conn, CSV_FILE)
-        ensure_book_id(conn)
+        # adds and fills book.id (db._migrate_book_key) along with the rest of the schema
+        migrate(conn)
+        # with its triggers in place the full-text index stays current: a delta sync goes through them,
+        # and a full import drops them and rebuilds the index once at the end (_deferred_book_indexes)
+        had_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'book_fts_%'").fetchone() is not None
+        if args.delta:
+            ensure_indexes(conn)
+            sync_csv(conn, CSV_FILE, workers=args.workers)
+        else:
+            if REPLACE_BOOKS:
+                print("REPLACE_BOOKS=True: wiping existing `book` rows.")
+            import_csv(conn, CSV_FILE, replace=REPLACE_BOOKS, workers=args.workers)
+            ensure_indexes(conn)
+        # consistency pass: recount per-client loan counters from the loans table
+        rebuild_loan_counts(conn, datetime.now().isoformat())
+        if ensure_book_fts(conn, rebuild=not had_fts):
+            print("Built full-text index for book search.")
+        else:
+            print("SQLite has no FTS5; book search will fall back to LIKE.")
     finally:
         conn.close()
+        if args.sql_stats:
+            sql_stats.dump(args.sql_stats)
+            print(f"SQL statement timings written to {args.sql_stats}.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,268 @@
+"""Per-statement timing for Rack-Track's SQL.
+
+TracedConnection is a sqlite3.Connection whose cursors time every
+statement, from execute until the cursor is closed or reused, so fetching
+the rows counts too. Statements are grouped by shape (literals replaced
+by ?, whitespace collapsed, IN lists folded) and QueryStats keeps each
+shape's count, total and p95 latency and rows returned. The app uses it
+through ConnectionPool(factory=TracedConnection); the Admin "Diagnostics"
+tab shows the numbers and can save them as JSON.
+
+Statements slower than SLOW_QUERY_MS are also appended to a rotating
+slow-query log next to the database. Only the SQL is written: bound
+parameters can hold passwords.
+"""
+import functools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from db import DB_PATH
+
+# statements at least this slow go to the slow-query log
+SLOW_QUERY_MS = 100
+SLOW_LOG_PATH = os.path.join(os.path.dirname(DB_PATH), "slow-queries.log")
+# the log rotates at this size, keeping this many old files
+SLOW_LOG_BYTES = 1024 * 1024
+SLOW_LOG_BACKUPS = 3
+# p95 is taken over each shape's most recent latencies
+LATENCY_SAMPLES = 500
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w?:$@.])-?\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_shape(sql):
+    """sql with literals as ?, whitespace collapsed and (?, ?, ...) lists folded, so variants group together."""
+    shape = _SPACE.sub(' ', _LITERALS.sub('?', sql)).strip()
+    return _IN_LISTS.sub('(?, ...)', shape)
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class _Shape:
+    __slots__ = ('count', 'errors', 'total_s', 'max_s', 'rows', 'recent')
+
+    def __init__(self):
+        self.count = self.errors = self.rows = 0
+        self.total_s = self.max_s = 0.0
+        self.recent = deque(maxlen=LATENCY_SAMPLES)
+
+
+class QueryStats:
+    """Latency and row counts per statement shape, shared by every traced connection; thread-safe."""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log_path=SLOW_LOG_PATH):
+        self.slow_ms = slow_ms
+        self.slow_log_path = slow_log_path
+        self.slow_count = 0
+        self._shapes = {}
+        self._lock = threading.Lock()
+        self._since = datetime.now()
+        self._slow_log = None
+
+    def record(self, sql, seconds, rows, failed=False):
+        shape = statement_shape(sql)
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                entry = self._shapes[shape] = _Shape()
+            entry.count += 1
+            entry.errors += failed
+            entry.total_s += seconds
+            entry.max_s = max(entry.max_s, seconds)
+            entry.rows += rows
+            entry.recent.append(seconds)
+            slow = self.slow_ms is not None and seconds * 1000 >= self.slow_ms
+            if slow:
+                self.slow_count += 1
+        if slow:
+            self._log_slow(sql, seconds, rows, failed)
+
+    def _log_slow(self, sql, seconds, rows, failed):
+        if self._slow_log is None:
+            # opened on the first slow statement, so tracing alone never creates the file
+            with self._lock:
+                if self._slow_log is None:
+                    log = logging.getLogger(f"rack-track.slow-sql.{id(self)}")
+                    log.propagate = False
+                    log.setLevel(logging.INFO)
+                    handler = RotatingFileHandler(self.slow_log_path, maxBytes=SLOW_LOG_BYTES, backupCount=SLOW_LOG_BACKUPS, encoding='utf-8')
+                    handler.setFormatter(logging.Formatter("%(asctime)s %(threadName)s %(message)s"))
+                    log.addHandler(handler)
+                    self._slow_log = log
+        status = " FAILED" if failed else ""
+        self._slow_log.info("%.1f ms rows=%d%s %s", seconds * 1000, rows, status, _SPACE.sub(' ', sql).strip())
+
+    def snapshot(self):
+        """One dict per statement shape, the most total time first."""
+        with self._lock:
+            items = [(shape, e.count, e.errors, e.total_s, e.max_s, e.rows, list(e.recent)) for shape, e in self._shapes.items()]
+        out = [
+            dict(
+                statement=shape, count=count, errors=errors, rows=rows,
+                total_ms=round(total_s * 1000, 2), mean_ms=round(total_s * 1000 / count, 3),
+                p95_ms=round(_percentile(recent, 0.95) * 1000, 3), max_ms=round(max_s * 1000, 3),
+            )
+            for shape, count, errors, total_s, max_s, rows, recent in items
+        ]
+        out.sort(key=lambda s: s['total_ms'], reverse=True)
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self.slow_count = 0
+            self._since = datetime.now()
+
+    def to_dict(self):
+        return {
+            'since': self._since.isoformat(timespec='seconds'),
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'slow_ms': self.slow_ms,
+            'slow_count': self.slow_count,
+            'slow_log': self.slow_log_path,
+            'statements': self.snapshot(),
+        }
+
+    def dump(self, path):
+        """Write to_dict() to path as JSON."""
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+
+
+# what every TracedConnection reports to unless its class says otherwise
+stats = QueryStats()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """A cursor that reports each statement's time and rows to the connection's QueryStats."""
+
+    # [sql, seconds so far, rows fetched, rows affected (None for a query)]
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except BaseException:
+            self.connection.stats.record(sql, time.perf_counter() - started, 0, failed=True)
+            raise
+        # queries are still running while their rows are fetched; they are recorded in _finish
+        self._pending = [sql, time.perf_counter() - started, 0, None if self.description else self.rowcount]
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except BaseException:
+            self.connection.stats.record(sql, time.perf_counter() - started, 0, failed=True)
+            raise
+        self.connection.stats.record(sql, time.perf_counter() - started, max(self.rowcount, 0))
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().executescript(sql_script)
+        except BaseException:
+            self.connection.stats.record(sql_script, time.perf_counter() - started, 0, failed=True)
+            raise
+        self.connection.stats.record(sql_script, time.perf_counter() - started, 0)
+        return self
+
+    def _fetched(self, started, rows):
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - started
+            self._pending[2] += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, seconds, fetched, affected = pending
+            self.connection.stats.record(sql, seconds, fetched if affected is None else max(affected, 0))
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # conn.execute(...).fetchone() never closes its cursor; it is recorded when dropped
+        self._finish()
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3.Connection whose statements and commits are timed into `stats`.
+
+    Pass it as the factory to sqlite3.connect or ConnectionPool.
+    """
+
+    stats = stats
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts open a plain cursor, so they are routed through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.stats.record("COMMIT", time.perf_counter() - started, 0)
@@ -0,0 +1,344 @@
+"""Shelf-reader telemetry ingest for Rack-Track.
+
+Readers report one line per tag read: `timestamp,book_code,rssi[,reader]`,
+with the timestamp either epoch seconds or "YYYY-MM-DD HH:MM:SS" (the
+dataset's format). This runs as its own process next to the app:
+
+    python telemetry.py --tail /var/log/shelf-readers.log
+    python telemetry.py --udp 127.0.0.1:7070
+
+A source thread parses lines into a bounded buffer; one writer thread
+drains it and group-commits batches into the append-only `readings` table.
+The database runs in WAL mode, so the app keeps reading while batches land.
+When the buffer is full a tailed file simply waits (nothing is lost, the
+file keeps it); UDP datagrams are dropped and counted. Metrics on both go
+to stdout every METRICS_INTERVAL_S seconds. If the writer fails for any
+reason other than a busy database, the sources stop and the process exits
+non-zero with the error.
+"""
+import argparse
+import os
+import queue
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from db import DB_PATH, apply_storage_profile
+
+# readings held in memory between the source and the writer
+BUFFER_READINGS = 50000
+# a batch is committed once it has this many readings or is this old
+GROUP_COMMIT_ROWS = 5000
+GROUP_COMMIT_MS = 200
+METRICS_INTERVAL_S = 10
+UDP_RCVBUF_BYTES = 4 * 1024 * 1024
+
+# AUTOINCREMENT: ids are never reused once the newest rows are pruned, so rollup.py's watermark holds.
+# tag is the reading_tags id of book_code, so presence.py can load the window as plain numbers
+READINGS_DDL = """
+CREATE TABLE IF NOT EXISTS readings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    book_code TEXT NOT NULL,
+    rssi INTEGER NOT NULL,
+    reader TEXT,
+    tag INTEGER NOT NULL
+)
+"""
+
+# every book_code any reader has ever reported, numbered from 1 in order of first sighting
+READING_TAGS_DDL = """
+CREATE TABLE IF NOT EXISTS reading_tags (
+    id INTEGER PRIMARY KEY,
+    book_code TEXT NOT NULL UNIQUE
+)
+"""
+
+
+def ensure_readings_table(conn):
+    """Create the append-only readings table; ts is epoch seconds, id (the rowid) order is arrival order."""
+    conn.execute(READINGS_DDL)
+    conn.execute(READING_TAGS_DDL)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_ts ON readings(ts)")
+    conn.commit()
+
+
+def append_readings(conn, batch, tags):
+    """Insert (ts, book_code, rssi, reader) readings in conn's open transaction, numbering new tags.
+
+    tags is the caller's {book_code: tag id} cache. Returns the entries for
+    tags not in it yet; add them once the transaction has committed, since
+    a rollback takes the new reading_tags rows back with it.
+    """
+    new = {}
+    for code in dict.fromkeys(r[1] for r in batch if r[1] not in tags):
+        conn.execute("INSERT OR IGNORE INTO reading_tags (book_code) VALUES (?)", (code,))
+        new[code] = conn.execute("SELECT id FROM reading_tags WHERE book_code = ?", (code,)).fetchone()[0]
+    conn.executemany(
+        "INSERT INTO readings (ts, book_code, rssi, reader, tag) VALUES (?,?,?,?,?)",
+        [r + (new.get(r[1]) or tags[r[1]],) for r in batch],
+    )
+    return new
+
+
+def _to_epoch(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text.strip()).timestamp()
+
+
+def parse_reading(line):
+    """(ts, book_code, rssi, reader) from one reader line; ValueError if it isn't one."""
+    parts = [p.strip() for p in line.split(',')]
+    if len(parts) not in (3, 4) or not parts[1]:
+        raise ValueError(f"bad reading: {line!r}")
+    return _to_epoch(parts[0]), parts[1], int(parts[2]), parts[3] if len(parts) == 4 else None
+
+
+class IngestMetrics:
+    """Counters shared by the source and writer threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.received = self.rejected = self.dropped = self.written = self.batches = 0
+        self.max_depth = 0
+        self.blocked_s = 0.0
+        self.commit_ms = 0.0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def seen_depth(self, depth):
+        if depth > self.max_depth:
+            with self._lock:
+                self.max_depth = max(self.max_depth, depth)
+
+    def snapshot(self, depth):
+        self.seen_depth(depth)
+        with self._lock:
+            return dict(
+                received=self.received, rejected=self.rejected, dropped=self.dropped, written=self.written,
+                batches=self.batches, depth=depth, max_depth=self.max_depth,
+                blocked_s=round(self.blocked_s, 2), last_commit_ms=round(self.commit_ms, 1),
+            )
+
+
+class Ingestor:
+    """Bounded buffer plus the single writer thread that owns the readings connection."""
+
+    def __init__(self, db_path, buffer_size=BUFFER_READINGS, batch_rows=GROUP_COMMIT_ROWS, batch_ms=GROUP_COMMIT_MS, halt=None):
+        """halt, if given, is the sources' stop event: it is set when the writer fails."""
+        self.db_path = db_path
+        self.buffer = queue.Queue(maxsize=buffer_size)
+        self.batch_rows = batch_rows
+        self.batch_s = batch_ms / 1000
+        self.metrics = IngestMetrics()
+        self._stop = threading.Event()
+        self.halt = halt or threading.Event()
+        # what ended the writer, if it failed; nothing is written after that
+        self.error = None
+        self._writer = threading.Thread(target=self._write_loop, name="readings-writer", daemon=True)
+
+    def start(self):
+        self._writer.start()
+
+    def stop(self):
+        """Flush what is buffered and stop the writer."""
+        self._stop.set()
+        self._writer.join()
+
+    def offer(self, reading, block=True):
+        """Queue one parsed reading. With block=False a full buffer drops it; returns whether it was queued."""
+        self.metrics.add(received=1)
+        try:
+            self.buffer.put_nowait(reading)
+            self.metrics.seen_depth(self.buffer.qsize())
+            return True
+        except queue.Full:
+            if not block:
+                self.metrics.add(dropped=1)
+                return False
+        # backpressure: the source waits for the writer to catch up, as long as there still is one
+        waited = time.perf_counter()
+        try:
+            while True:
+                try:
+                    self.buffer.put(reading, timeout=0.5)
+                    return True
+                except queue.Full:
+                    if self.halt.is_set() or not self._writer.is_alive():
+                        self.metrics.add(dropped=1)
+                        return False
+        finally:
+            self.metrics.add(blocked_s=time.perf_counter() - waited)
+
+    def depth(self):
+        return self.buffer.qsize()
+
+    def _write_loop(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            apply_storage_profile(conn)
+            ensure_readings_table(conn)
+            tags = dict(conn.execute("SELECT book_code, id FROM reading_tags"))
+            while not (self._stop.is_set() and self.buffer.empty()):
+                batch = self._next_batch()
+                if not batch:
+                    continue
+                started = time.perf_counter()
+                tags.update(self._commit(conn, batch, tags))
+                self.metrics.add(written=len(batch), batches=1)
+                self.metrics.commit_ms = (time.perf_counter() - started) * 1000
+        except BaseException as e:
+            # a disk, permission or schema error won't go away by retrying: stop the sources instead of
+            # leaving them blocked on a buffer nobody drains
+            self.error = e
+            self.halt.set()
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _commit(self, conn, batch, tags):
+        """Append one batch, retrying while another connection holds the write lock past busy_timeout.
+
+        Returns the tags it numbered (see append_readings).
+        """
+        while True:
+            try:
+                new = append_readings(conn, batch, tags)
+                conn.commit()
+                return new
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                conn.rollback()
+                time.sleep(0.1)
+
+    def _next_batch(self):
+        """Block for the first reading, then gather more until the batch is full or batch_s has passed."""
+        try:
+            batch = [self.buffer.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_s
+        while len(batch) < self.batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.buffer.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+
+def tail_lines(path, stop, poll_s=0.2):
+    """Lines appended to path, following truncation and rotation, until stop is set."""
+    fh = open(path, encoding='utf-8', errors='replace')
+    fh.seek(0, os.SEEK_END)
+    partial = ''
+    try:
+        while not stop.is_set():
+            chunk = fh.readline()
+            if chunk:
+                partial += chunk
+                if partial.endswith('\n'):
+                    yield partial
+                    partial = ''
+                continue
+            time.sleep(poll_s)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_ino != os.fstat(fh.fileno()).st_ino or st.st_size < fh.tell():
+                # rotated or truncated: start over on the new file
+                fh.close()
+                fh = open(path, encoding='utf-8', errors='replace')
+                partial = ''
+    finally:
+        fh.close()
+
+
+def udp_lines(address, stop):
+    """Lines received as UDP datagrams on address (host, port); a datagram may hold several."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # datagrams that overflow the kernel buffer are lost before they can be counted
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF_BYTES)
+    sock.bind(address)
+    sock.settimeout(0.5)
+    try:
+        while not stop.is_set():
+            try:
+                data, _ = sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            yield from data.decode('utf-8', errors='replace').splitlines()
+    finally:
+        sock.close()
+
+
+def ingest(lines, ingestor, block=True):
+    """Parse lines into the ingestor's buffer; unparseable lines are counted, not stored."""
+    for line in lines:
+        if ingestor.halt.is_set():
+            break
+        if not line.strip():
+            continue
+        try:
+            reading = parse_reading(line)
+        except ValueError:
+            ingestor.metrics.add(rejected=1)
+            continue
+        ingestor.offer(reading, block=block)
+
+
+def _report(ingestor, stop):
+    while not stop.wait(METRICS_INTERVAL_S):
+        m = ingestor.metrics.snapshot(ingestor.depth())
+        print(" ".join(f"{k}={v}" for k, v in m.items()), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest shelf-reader telemetry into the Rack-Track database.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--tail", metavar="FILE", help="follow a log file readers append to")
+    source.add_argument("--udp", metavar="HOST:PORT", help="listen for readings sent as UDP datagrams")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    stop = threading.Event()
+    # a service manager's SIGTERM ends the sources; the writer then flushes the buffer
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    ingestor = Ingestor(args.db, halt=stop)
+    ingestor.start()
+    threading.Thread(target=_report, args=(ingestor, stop), daemon=True).start()
+    if args.tail:
+        lines, block = tail_lines(args.tail, stop), True
+    else:
+        host, port = args.udp.rsplit(':', 1)
+        lines, block = udp_lines((host, int(port)), stop), False
+    try:
+        ingest(lines, ingestor, block=block)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        ingestor.stop()
+        print(" ".join(f"{k}={v}" for k, v in ingestor.metrics.snapshot(ingestor.depth()).items()), flush=True)
+    if ingestor.error is not None:
+        print(f"Readings writer failed, {ingestor.depth()} buffered readings not written: {ingestor.error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
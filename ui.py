@@ -1,4 +1,5 @@
 from PyQt5.QtWidgets import (
+    QApplication,
     QPushButton,
     QMainWindow,
     QWidget,
@@ -8,85 +9,117 @@ from PyQt5.QtWidgets import (
     QLineEdit,
     QDialog,
     QDialogButtonBox,
+    QFileDialog,
     QMessageBox,
     QInputDialog,
     QTabWidget,
+    QTableView,
     QTableWidget,
     QTableWidgetItem,
     QHeaderView,
     QComboBox,
     QScrollArea,
+    QListView,
+    QListWidget,
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import (
     QIcon,
     QFont,
 )
-import sqlite3       
+import os
+import sqlite3
+import sys
+import time
 from datetime import datetime
 from datetime import timedelta
 
-connection = sqlite3.connect("rack-track.db")
-connection.row_factory = sqlite3.Row # to access columns by name
+from background import Backdrop
+from cache import RefinementCache
+from db import (
+    BOOK_KEY, DB_PATH, AdminRepo, BookRepo, BookUnavailable, Checkpointer, ClientRepo, ConnectionPool, LoanLimitReached,
+    LoanNotOpen, LoanRepo, ensure_indexes, is_busy, migrate,
+)
+from models import PagedListModel, PagedTableModel, selected_rows
+from sqltrace import TracedConnection, stats as sql_stats
+from workers import DEBOUNCE_MS, QueryExecutor
+
+# idle time after a tab is shown before the next tab is built and starts loading
+PREFETCH_DELAY_MS = 300
+
+# shown when a checkout or return times out waiting for another desk's write
+DESK_BUSY_MESSAGE = "Another desk is busy updating the library; nothing was changed. Please try again in a moment."
+
+# icons and backgrounds, found relative to the code rather than the working directory
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# connections open on first use, so importing this module touches no file (see prepare_database);
+# every statement is timed into sql_stats, shown on the admin Diagnostics tab
+pool = ConnectionPool(DB_PATH, factory=TracedConnection)
+books = BookRepo(pool)
+clients = ClientRepo(pool)
+admins = AdminRepo(pool)
+loans = LoanRepo(pool)
+# keeps the shared WAL file short while desks are open; main.py starts and stops it
+checkpointer = Checkpointer(pool.path)
+# complete filter results, reused while a filter is being extended
+result_cache = RefinementCache()
+# why prepare_database() could not bring the schema up to date, or None; main.py shows it
+schema_error = None
+
+
+def book_id_from_text(text):
+    """Parse a book id typed into a prompt; None if it is not a number."""
+    try:
+        return int(text.strip())
+    except ValueError:
+        return None
 
 
 def ensure_loans_table():
-    """Create a simple loans table for issue/return tracking if it doesn't exist."""
-    cur = connection.cursor()
-    try:
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS loans (
-                loan_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id INTEGER,
-                client_username TEXT,
-                book_pk TEXT,
-                book_title TEXT,
-                issued_at TEXT,
-                due_date TEXT,
-                returned_at TEXT
-            )
-            """
-        )
-        connection.commit()
-    finally:
-        cur.close()
+    """Create the loans table and its loan_counts triggers if they don't exist.
+
+    This writes (it seeds loan_counts_state), so it runs once from
+    prepare_database, never on a read path.
+    """
+    loans.ensure_table()
 
 
-def ensure_book_id_column():
-    """Ensure book table has an 'id' column. If missing, add it and populate from rowid.
+def prepare_database():
+    """Open the GUI thread's connection and bring the file up to date.
 
-    This avoids OperationalError when code references 'id' alongside 'isbn'.
-    The added 'id' will not be the PRIMARY KEY (we keep existing isbn PK) but
-    will be populated with rowid values for stable numeric ids.
+    main.py calls this once the welcome screen has painted. Returns the
+    seconds spent (connecting, checking the schema) for --profile-startup.
+    A failure (a locked or read-only file) is printed and kept in
+    schema_error; the app then runs on the schema the file already has.
     """
-    cur = connection.cursor()
+    global schema_error
+    started = time.perf_counter()
+    connection = pool.connection()
+    connected = time.perf_counter()
     try:
-        cur.execute("PRAGMA table_info(book)")
-        cols = [r[1] for r in cur.fetchall()]
-        if 'id' not in cols:
-            # add id column (nullable integer)
-            cur.execute("ALTER TABLE book ADD COLUMN id INTEGER")
-            # populate id from rowid for existing rows
-            try:
-                cur.execute("UPDATE book SET id = rowid WHERE id IS NULL")
-            except Exception:
-                # some sqlite builds or edge cases could fail; ignore but continue
-                pass
-            # create index for faster lookups
-            try:
-                cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_book_id ON book(id)")
-            except Exception:
-                pass
-            connection.commit()
-    finally:
-        cur.close()
-# ensure helpful compatibility columns exist at startup
-try:
-    ensure_loans_table()
-except Exception:
-    # if DB is locked or not writable, we'll attempt again later when needed
-    pass
+        ensure_loans_table()
+        # bring older database files up to the current schema (a no-op afterwards)
+        migrate(connection)
+        # DBs set up before the index set existed get it here (a no-op afterwards)
+        ensure_indexes(connection)
+        schema_error = None
+    except Exception as e:
+        connection.rollback()
+        schema_error = e
+        print(f"Could not update the database schema in {pool.path}: {e}", file=sys.stderr)
+    return connected - started, time.perf_counter() - connected
+
+
+def format_book(book):
+    """Render one Search Book result; missing columns (older DBs) show as blanks."""
+    def val(col):
+        v = book.get(col)
+        return '' if v is None else v
+    code = f" [{val('book_code')}]" if val('book_code') else ''
+    return (f"{val('id') or val('isbn')}{code}: {val('title')}\n  Author: {val('author')} | Category: {val('category')} | "
+            f"Status: {val('status')} | Cabinet-Rack-Row: {val('rack_column_row')} | Year: {val('year')} | ISBN: {val('isbn')}")
+
 
 # loan policy defaults
 MAX_LOANS = 5
@@ -98,10 +131,13 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("RACK-TRACK")
-        self.setWindowIcon(QIcon('assets/icon.png'))
-        self.setStyleSheet('''QMainWindow{border-image : url('assets/b_g.png') 0 0 0 0 stretch stretch;
-            }''')
-        central = QWidget()
+        self.setWindowIcon(QIcon(os.path.join(ASSETS_DIR, 'icon.png')))
+        # the background is drawn from a cached pixmap scaled for this screen, not a style-sheet border-image
+        central = Backdrop(os.path.join(ASSETS_DIR, 'b_g.png'))
+        screen = QApplication.primaryScreen()
+        if screen is not None:
+            # the window opens maximized, so scale for the screen before the first paint
+            central.prescale(screen.availableGeometry().size())
         layout = QVBoxLayout()
         # push the whole content a bit down so the top text appears lower on large screens
         layout.setContentsMargins(0, 40, 0, 0)
@@ -142,152 +178,6 @@ class MainWindow(QMainWindow):
         admin_btn.clicked.connect(self.open_admin)
         client_btn.clicked.connect(self.open_client)
 
-    # ---- Client window helpers: search, checkout, my loans ----
-    def _detect_book_columns_client(self):
-        cur = connection.cursor()
-        try:
-            cur.execute("PRAGMA table_info(book)")
-            cols = [row[1] for row in cur.fetchall()]
-        finally:
-            cur.close()
-        preferred = ['id', 'title', 'author', 'status', 'rack_column_row', 'year', 'isbn']
-        ordered = [c for c in preferred if c in cols]
-        for c in cols:
-            if c not in ordered:
-                ordered.append(c)
-        return ordered
-
-    def load_search_results(self, filter_text=''):
-        cols = self._detect_book_columns_client()
-        if not cols:
-            return
-        sel_sql = ",".join(cols)
-        sql = f"SELECT {sel_sql} FROM book"
-        params = ()
-        if filter_text:
-            sql += " WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ?"
-            params = (f"%{filter_text}%", f"%{filter_text}%", f"%{filter_text}%")
-        cur = connection.cursor()
-        try:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-        finally:
-            cur.close()
-
-        self.search_table.setColumnCount(len(cols))
-        self.search_table.setHorizontalHeaderLabels([c.upper() for c in cols])
-        self.search_table.setRowCount(len(rows))
-        for r_i, r in enumerate(rows):
-            for c_i, col in enumerate(cols):
-                val = r[col] if col in r.keys() else ''
-                self.search_table.setItem(r_i, c_i, QTableWidgetItem(str(val) if val is not None else ''))
-
-    def checkout_selected(self):
-        # ensure loans table
-        ensure_loans_table()
-        # find selected book in search_table
-        selected = self.search_table.selectedItems()
-        if not selected:
-            QMessageBox.warning(self, "Select book", "Please select a book to check out.")
-            return
-        row_idx = selected[0].row()
-        # assume first column is pk (id or isbn)
-        pk_val = self.search_table.item(row_idx, 0).text()
-        # get title
-        title = self.search_table.item(row_idx, 1).text() if self.search_table.columnCount() > 1 else ''
-        # determine client id/username stored on this window
-        client_id = getattr(self, 'client_id', None)
-        client_username = getattr(self, 'username', '')
-
-        # check book availability
-        cur = connection.cursor()
-        try:
-            cur.execute("SELECT * FROM book WHERE isbn = ? OR id = ?", (pk_val, pk_val))
-            book_row = cur.fetchone()
-        finally:
-            cur.close()
-        if book_row and 'status' in book_row.keys() and book_row['status'] == 'checked out':
-            QMessageBox.warning(self, "Unavailable", "Book is already checked out.")
-            return
-
-        # enforce max loans per client
-        cur = connection.cursor()
-        try:
-            if client_id is not None:
-                cur.execute("SELECT COUNT(*) FROM loans WHERE client_id = ? AND returned_at IS NULL", (client_id,))
-            else:
-                cur.execute("SELECT COUNT(*) FROM loans WHERE client_username = ? AND returned_at IS NULL", (client_username,))
-            out_count = cur.fetchone()[0]
-        finally:
-            cur.close()
-
-        if out_count >= MAX_LOANS:
-            QMessageBox.warning(self, "Limit reached", f"You already have {out_count} outstanding loans (max {MAX_LOANS}). Return some books before checking out more.")
-            return
-
-        # insert loan with due date and mark book checked out
-        issued_at = datetime.now()
-        due = (issued_at + timedelta(days=LOAN_DAYS)).isoformat()
-        issued_at_iso = issued_at.isoformat()
-        cur = connection.cursor()
-        try:
-            cur.execute(
-                "INSERT INTO loans (client_id, client_username, book_pk, book_title, issued_at, due_date, returned_at) VALUES (?,?,?,?,?,?,NULL)",
-                (client_id, client_username, pk_val, title, issued_at_iso, due),
-            )
-            cur.execute("UPDATE book SET status = 'checked out' WHERE isbn = ? OR id = ?", (pk_val, pk_val))
-            connection.commit()
-        finally:
-            cur.close()
-
-        QMessageBox.information(self, "Checked out", "Book checked out successfully.")
-        # refresh my loans and search results
-        self.load_my_loans()
-        self.load_search_results(self.search_table.item(row_idx, 0).text())
-
-    def load_my_loans(self):
-        ensure_loans_table()
-        cur = connection.cursor()
-        try:
-            if getattr(self, 'client_id', None) is not None:
-                cur.execute("SELECT loan_id, book_pk, book_title, issued_at, due_date, returned_at FROM loans WHERE client_id = ? ORDER BY issued_at DESC", (self.client_id,))
-            else:
-                cur.execute("SELECT loan_id, book_pk, book_title, issued_at, due_date, returned_at FROM loans WHERE client_username = ? ORDER BY issued_at DESC", (getattr(self, 'username', ''),))
-            rows = cur.fetchall()
-        finally:
-            cur.close()
-
-        cols = ['LOAN_ID', 'BOOK', 'TITLE', 'ISSUED_AT', 'DUE_DATE', 'RETURNED_AT']
-        self.my_loans_table.setColumnCount(len(cols))
-        self.my_loans_table.setHorizontalHeaderLabels(cols)
-        self.my_loans_table.setRowCount(len(rows))
-        for r_i, r in enumerate(rows):
-            self.my_loans_table.setItem(r_i, 0, QTableWidgetItem(str(r['loan_id'])))
-            self.my_loans_table.setItem(r_i, 1, QTableWidgetItem(str(r['book_pk'])))
-            self.my_loans_table.setItem(r_i, 2, QTableWidgetItem(str(r['book_title'])))
-            self.my_loans_table.setItem(r_i, 3, QTableWidgetItem(str(r['issued_at'])))
-            self.my_loans_table.setItem(r_i, 4, QTableWidgetItem(str(r.get('due_date') or '')))
-            self.my_loans_table.setItem(r_i, 5, QTableWidgetItem(str(r['returned_at'] or '')))
-
-    def return_selected(self):
-        selected = self.my_loans_table.selectedItems()
-        if not selected:
-            QMessageBox.warning(self, "Select loan", "Please select a loan to return.")
-            return
-        row_idx = selected[0].row()
-        loan_id = self.my_loans_table.item(row_idx, 0).text()
-        book_pk = self.my_loans_table.item(row_idx, 1).text()
-        now = datetime.now().isoformat()
-        cur = connection.cursor()
-        try:
-            cur.execute("UPDATE loans SET returned_at = ? WHERE loan_id = ?", (now, loan_id))
-            cur.execute("UPDATE book SET status = 'available' WHERE isbn = ? OR id = ?", (book_pk, book_pk))
-            connection.commit()
-        finally:
-            cur.close()
-        QMessageBox.information(self, "Returned", "Book marked as returned.")
-        self.load_my_loans()
-
         # keep a reference to any opened child window so it doesn't get garbage collected
         self._child_window = None
 
@@ -301,15 +191,7 @@ class MainWindow(QMainWindow):
 
             username, password = dlg.get_credentials()
 
-            # validate using a local cursor and parameterized query
-            local_cur = connection.cursor()
-            try:
-                local_cur.execute("SELECT 1 FROM admin WHERE username = ? AND password = ?", (username, password))
-                result = local_cur.fetchone()
-            finally:
-                local_cur.close()
-
-            if result:
+            if admins.authenticate(username, password):
                 admin_window = AdminWindow(username=username, parent=self)
                 admin_window.show()
                 self._child_window = admin_window
@@ -325,15 +207,9 @@ class MainWindow(QMainWindow):
             if dlg.exec() != QDialog.Accepted:
                 return
             username,password = dlg.get_credentials()          
-            local_cur = connection.cursor()
-            try:
-                local_cur.execute("SELECT client_id FROM client WHERE username = ? AND password = ?", (username, password))
-                row = local_cur.fetchone()
-            finally:
-                local_cur.close()
-
-            if row:
-                client_id = row['client_id'] if 'client_id' in row.keys() else None
+            client_id = clients.authenticate(username, password)
+
+            if client_id is not None:
                 client_window = ClientWindow(client_id=client_id, username=username, parent=self)
                 client_window.show()
                 self._child_window = client_window
@@ -392,10 +268,84 @@ class AdminWindow(QMainWindow):
         layout = QVBoxLayout()
         self.tab = QTabWidget()
         layout.addWidget(self.tab)
-        tab1_content = QWidget()
-        tab1_layout = QVBoxLayout()
-        tab1_content.setLayout(tab1_layout)
+        # each tab is built, and its data loaded, the first time it is shown (see _activate_tab);
+        # until then its page only holds a placeholder, so opening the window never waits on the DB
+        self._tab_builders = [
+            ("Search Book", self._build_search_tab, None),
+            ("Manage Books", self._build_books_tab, self.load_books),
+            ("Manage Clients", self._build_clients_tab, self.load_clients),
+            ("Issue Summary", self._build_summary_tab, self.load_issue_summary),
+            ("Diagnostics", self._build_diagnostics_tab, self.load_diagnostics),
+        ]
+        self._built = set()
+        self._loaded = set()
+        for title, _, _ in self._tab_builders:
+            page = QWidget()
+            page_layout = QVBoxLayout()
+            page.setLayout(page_layout)
+            page_layout.placeholder = QLabel("Loading...")
+            page_layout.placeholder.setAlignment(Qt.AlignCenter)
+            page_layout.addWidget(page_layout.placeholder)
+            self.tab.addTab(page, title)
+
+        layout.addWidget(QLabel(f"Welcome Admin: {username}"))
+        central.setLayout(layout)
+        # Wrap the central widget in a scroll area so the admin UI is scrollable on small screens
+        admin_scroll = QScrollArea()
+        admin_scroll.setWidgetResizable(True)
+        admin_scroll.setWidget(central)
+        self.setCentralWidget(admin_scroll)
+
+        # one executor per filter box, so a new book filter only cancels book queries
+        self.book_query = QueryExecutor(pool, self)
+        self.client_query = QueryExecutor(pool, self)
+        self.summary_query = QueryExecutor(pool, self)
+
+        # the tab after the one being shown is the likely next stop; it is prepared once the GUI is idle
+        self._prefetch_index = None
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.timeout.connect(self._prefetch)
+        self.tab.currentChanged.connect(self._activate_tab)
+        self._activate_tab(self.tab.currentIndex())
+
+    def closeEvent(self, event):
+        # nothing is left to show the results of queries still queued or running
+        for executor in (self.book_query, self.client_query, self.summary_query):
+            executor.cancel()
+        super().closeEvent(event)
+
+    def _activate_tab(self, index):
+        """Build and load the tab being shown, then schedule a prefetch of the one after it."""
+        self._ensure_tab(index)
+        self._prefetch_index = index + 1
+        self._prefetch_timer.start(PREFETCH_DELAY_MS)
+
+    def _prefetch(self):
+        if self._prefetch_index is not None and self._prefetch_index < self.tab.count():
+            self._ensure_tab(self._prefetch_index)
+
+    def _ensure_tab(self, index):
+        """Build tab `index` and start its first load, once."""
+        if not 0 <= index < len(self._tab_builders):
+            return
+        self._build_tab(index)
+        load = self._tab_builders[index][2]
+        if load is not None and index not in self._loaded:
+            # the loads run on worker threads; their results fill the tab when they arrive
+            load()
+
+    def _build_tab(self, index):
+        """Put tab `index`'s widgets in place of its placeholder, once; its loader calls this first."""
+        if index in self._built:
+            return
+        self._built.add(index)
+        layout = self.tab.widget(index).layout()
+        layout.removeWidget(layout.placeholder)
+        layout.placeholder.deleteLater()
+        self._tab_builders[index][1](layout)
 
+    def _build_search_tab(self, layout):
         # top row: left = search controls, right = vertical action buttons
         top_row = QHBoxLayout()
         left_col = QVBoxLayout()
@@ -403,7 +353,7 @@ class AdminWindow(QMainWindow):
 
         # Search controls (left)
         left_col.search_input = QLineEdit(self)
-        left_col.search_input.setPlaceholderText("Enter title, author, year or ISBN to search")
+        left_col.search_input.setPlaceholderText("Enter title, author, year, ISBN or book code (e.g. B042) to search")
         left_col.addWidget(left_col.search_input)
 
         left_col.search_button = QPushButton("SEARCH BOOK", self)
@@ -413,6 +363,19 @@ class AdminWindow(QMainWindow):
         left_col.addWidget(left_col.search_button)
         left_col.addWidget(left_col.show_all)
 
+        # shelf browser: cabinet, optionally narrowed to a rack and a row of it
+        shelf_controls = QHBoxLayout()
+        left_col.cabinet_input = QLineEdit(self)
+        left_col.cabinet_input.setPlaceholderText("Cabinet")
+        left_col.rack_input = QLineEdit(self)
+        left_col.rack_input.setPlaceholderText("Rack (optional)")
+        left_col.row_input = QLineEdit(self)
+        left_col.row_input.setPlaceholderText("Row (optional)")
+        left_col.show_shelf = QPushButton("SHOW SHELF", self)
+        for w in (left_col.cabinet_input, left_col.rack_input, left_col.row_input, left_col.show_shelf):
+            shelf_controls.addWidget(w)
+        left_col.addLayout(shelf_controls)
+
         # Vertical action buttons (right)
         right_buttons.available = QPushButton("AVAILABLE BOOKS")
         right_buttons.issue = QPushButton("CHECKED OUT BOOKS")
@@ -424,334 +387,218 @@ class AdminWindow(QMainWindow):
 
         top_row.addLayout(left_col)
         top_row.addLayout(right_buttons)
-        tab1_layout.addLayout(top_row)
-
-        tab1_layout.search_input = left_col.search_input
-        tab1_layout.search_button = left_col.search_button
-        tab1_layout.show_all = left_col.show_all
-        tab1_layout.available = right_buttons.available
-        tab1_layout.issue = right_buttons.issue
-        tab1_layout.lost = right_buttons.lost
+        layout.addLayout(top_row)
+
+        layout.search_input = left_col.search_input
+        layout.search_button = left_col.search_button
+        layout.show_all = left_col.show_all
+        layout.cabinet_input = left_col.cabinet_input
+        layout.rack_input = left_col.rack_input
+        layout.row_input = left_col.row_input
+        layout.available = right_buttons.available
+        layout.issue = right_buttons.issue
+        layout.lost = right_buttons.lost
 
         left_col.search_button.clicked.connect(self.search_book)
         left_col.show_all.clicked.connect(self.show_books)
+        left_col.show_shelf.clicked.connect(self.show_shelf)
         right_buttons.issue.clicked.connect(self.show_issued_books)
         right_buttons.lost.clicked.connect(self.show_lost_books)
         right_buttons.available.clicked.connect(self.show_available_books)
 
-        # Results area (show labelled results including status)
-        tab1_layout.result_label = QLabel("", self)
-        tab1_layout.result_label.setWordWrap(True)
-        # Put the result label into a scroll area so long search outputs scroll
-        tab1_layout.scroll_area = QScrollArea()
-        tab1_layout.scroll_area.setWidgetResizable(True)
-        _result_container = QWidget()
-        _result_layout = QVBoxLayout()
-        _result_layout.setContentsMargins(0, 0, 0, 0)
-        _result_layout.addWidget(tab1_layout.result_label)
-        _result_container.setLayout(_result_layout)
-        tab1_layout.scroll_area.setWidget(_result_container)
-        tab1_layout.addWidget(tab1_layout.scroll_area)
-
-        self.tab.addTab(tab1_content, "Search Book")
-
-        # Create the second tab
-        tab2_content = QWidget()
-        tab2_layout = QVBoxLayout()
-        tab2_content.setLayout(tab2_layout)
-
+        # Results area: a status line plus a paged list that only renders visible rows
+        layout.result_label = QLabel("", self)
+        layout.result_label.setWordWrap(True)
+        layout.addWidget(layout.result_label)
+        layout.result_view = QListView()
+        self.result_model = PagedListModel(format_book, self)
+        layout.result_view.setModel(self.result_model)
+        # every result is two lines, so let the view skip per-row size hints
+        layout.result_view.setUniformItemSizes(True)
+        layout.result_view.setAlternatingRowColors(True)
+        layout.result_view.setSpacing(4)
+        layout.addWidget(layout.result_view)
+
+    def _build_books_tab(self, layout):
         # Book management: filter + table + buttons
-        tab2_layout.addWidget(QLabel("Books Management"))
-        tab2_layout.book_search = QLineEdit(self)
-        tab2_layout.book_search.setPlaceholderText("Filter books by title/author")
-        tab2_layout.addWidget(tab2_layout.book_search)
+        layout.addWidget(QLabel("Books Management"))
+        layout.book_search = QLineEdit(self)
+        layout.book_search.setPlaceholderText("Filter books by title/author")
+        layout.addWidget(layout.book_search)
 
         buttons_row = QHBoxLayout()
-        tab2_layout.addLayout(buttons_row)
-        tab2_layout.add_btn = QPushButton("Add Book")
-        tab2_layout.edit_btn = QPushButton("Edit Selected")
-        tab2_layout.remove_btn = QPushButton("Remove Selected")
-        buttons_row.addWidget(tab2_layout.add_btn)
-        buttons_row.addWidget(tab2_layout.edit_btn)
-        buttons_row.addWidget(tab2_layout.remove_btn)
-
-        # replace the old results label with a QTableWidget for clear columns
-        self.book_table = QTableWidget()
-        self.book_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.book_table.setSelectionMode(QTableWidget.SingleSelection)
+        layout.addLayout(buttons_row)
+        layout.add_btn = QPushButton("Add Book")
+        layout.edit_btn = QPushButton("Edit Selected")
+        layout.remove_btn = QPushButton("Remove Selected")
+        buttons_row.addWidget(layout.add_btn)
+        buttons_row.addWidget(layout.edit_btn)
+        buttons_row.addWidget(layout.remove_btn)
+
+        # paged table: rows are pulled from the DB as the view scrolls
+        self.book_table = QTableView()
+        self.book_model = PagedTableModel(self)
+        self.book_table.setModel(self.book_model)
+        self.book_table.setSelectionBehavior(QTableView.SelectRows)
+        self.book_table.setSelectionMode(QTableView.SingleSelection)
         self.book_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        tab2_layout.addWidget(self.book_table)
-        # connect selection change handler once
-        self.book_table.itemSelectionChanged.connect(self._on_book_selection_changed)
+        layout.addWidget(self.book_table)
+        # connect selection change handler once (the selection model survives model resets)
+        self.book_table.selectionModel().selectionChanged.connect(self._on_book_selection_changed)
 
         # ensure table scrollbars appear when needed
         self.book_table.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.book_table.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
 
         # wire buttons
-        tab2_layout.add_btn.clicked.connect(self.add_book_dialog)
-        tab2_layout.edit_btn.clicked.connect(self.edit_book_dialog)
-        tab2_layout.remove_btn.clicked.connect(self.remove_book)
-        tab2_layout.book_search.textChanged.connect(lambda t: self.load_books(t))
-
-        self.tab.addTab(tab2_content, "Manage Books")
-
-        tab3_content = QWidget()
-        tab3_layout = QVBoxLayout()
-        tab3_content.setLayout(tab3_layout)
+        layout.add_btn.clicked.connect(self.add_book_dialog)
+        layout.edit_btn.clicked.connect(self.edit_book_dialog)
+        layout.remove_btn.clicked.connect(self.remove_book)
+        layout.book_search.textChanged.connect(lambda t: self.load_books(t, debounce=True))
 
-        tab3_layout.addWidget(QLabel("Clients Management"))
-        tab3_layout.client_search = QLineEdit(self)
-        tab3_layout.client_search.setPlaceholderText("Filter clients by username/email")
-        tab3_layout.addWidget(tab3_layout.client_search)
+    def _build_clients_tab(self, layout):
+        layout.addWidget(QLabel("Clients Management"))
+        layout.client_search = QLineEdit(self)
+        layout.client_search.setPlaceholderText("Filter clients by username/email")
+        layout.addWidget(layout.client_search)
 
         crow = QHBoxLayout()
-        tab3_layout.addLayout(crow)
-        tab3_layout.add_btn = QPushButton("Add Client")
-        tab3_layout.edit_btn = QPushButton("Edit Selected")
-        tab3_layout.remove_btn = QPushButton("Remove Selected")
-        crow.addWidget(tab3_layout.add_btn)
-        crow.addWidget(tab3_layout.edit_btn)
-        crow.addWidget(tab3_layout.remove_btn)
+        layout.addLayout(crow)
+        layout.add_btn = QPushButton("Add Client")
+        layout.edit_btn = QPushButton("Edit Selected")
+        layout.remove_btn = QPushButton("Remove Selected")
+        crow.addWidget(layout.add_btn)
+        crow.addWidget(layout.edit_btn)
+        crow.addWidget(layout.remove_btn)
 
         # client table
-        self.client_table = QTableWidget()
-        self.client_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.client_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.client_table = QTableView()
+        self.client_model = PagedTableModel(self)
+        self.client_table.setModel(self.client_model)
+        self.client_table.setSelectionBehavior(QTableView.SelectRows)
+        self.client_table.setSelectionMode(QTableView.SingleSelection)
         self.client_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        tab3_layout.addWidget(self.client_table)
+        layout.addWidget(self.client_table)
         self.client_table.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.client_table.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
 
         # wire client buttons
-        tab3_layout.add_btn.clicked.connect(self.add_client_dialog)
-        tab3_layout.edit_btn.clicked.connect(self.edit_client_dialog)
-        tab3_layout.remove_btn.clicked.connect(self.remove_client)
-        tab3_layout.client_search.textChanged.connect(lambda t: self.load_clients(t))
+        layout.add_btn.clicked.connect(self.add_client_dialog)
+        layout.edit_btn.clicked.connect(self.edit_client_dialog)
+        layout.remove_btn.clicked.connect(self.remove_client)
+        layout.client_search.textChanged.connect(lambda t: self.load_clients(t, debounce=True))
 
         # connect selection handler
-        self.client_table.itemSelectionChanged.connect(self._on_client_selection_changed)
+        self.client_table.selectionModel().selectionChanged.connect(self._on_client_selection_changed)
 
-        # add the tab
-        self.tab.addTab(tab3_content, "Manage Clients")
-
-        # --- Issue summary tab for admin: who issued how many books ---
-        tab4_content = QWidget()
-        tab4_layout = QVBoxLayout()
-        tab4_content.setLayout(tab4_layout)
-        tab4_layout.addWidget(QLabel("Issue Summary (who issued how many books)"))
-        tab4_layout.refresh_btn = QPushButton("Refresh")
-        tab4_layout.addWidget(tab4_layout.refresh_btn)
+    def _build_summary_tab(self, layout):
+        layout.addWidget(QLabel("Issue Summary (who issued how many books)"))
+        layout.refresh_btn = QPushButton("Refresh")
+        layout.addWidget(layout.refresh_btn)
 
+        self.issue_status = QLabel("", self)
+        layout.addWidget(self.issue_status)
         self.issue_table = QTableWidget()
         self.issue_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        tab4_layout.addWidget(self.issue_table)
-
-        tab4_layout.refresh_btn.clicked.connect(self.load_issue_summary)
-        self.tab.addTab(tab4_content, "Issue Summary")
-
-        layout.addWidget(QLabel(f"Welcome Admin: {username}"))
-        central.setLayout(layout)
-        # Wrap the central widget in a scroll area so the admin UI is scrollable on small screens
-        admin_scroll = QScrollArea()
-        admin_scroll.setWidgetResizable(True)
-        admin_scroll.setWidget(central)
-        self.setCentralWidget(admin_scroll)
-
-        # detect book columns and populate table
-        self._book_columns = self._detect_book_columns()
-        # set up table headers
-        self.book_table.setColumnCount(len(self._book_columns))
-        self.book_table.setHorizontalHeaderLabels([c.upper() for c in self._book_columns])
-        # load initial book list
-        self.load_books()
-        # setup clients table and load
-        self._client_columns = self._detect_client_columns()
-        if hasattr(self, 'client_table') and self._client_columns:
-            self.client_table.setColumnCount(len(self._client_columns))
-            self.client_table.setHorizontalHeaderLabels([c.upper() for c in self._client_columns])
-            self.load_clients()
-        # load issue summary table
-        try:
-            self.load_issue_summary()
-        except Exception:
-            # non-fatal if loans table missing or other issue
-            pass
+        layout.addWidget(self.issue_table)
+
+        layout.refresh_btn.clicked.connect(self.load_issue_summary)
+
+    def _build_diagnostics_tab(self, layout):
+        layout.addWidget(QLabel("SQL statements by total time (since the app started or the last reset)"))
+        buttons = QHBoxLayout()
+        layout.refresh_btn = QPushButton("Refresh")
+        layout.reset_btn = QPushButton("Reset")
+        layout.dump_btn = QPushButton("Save as JSON...")
+        for btn in (layout.refresh_btn, layout.reset_btn, layout.dump_btn):
+            buttons.addWidget(btn)
+        layout.addLayout(buttons)
+
+        self.diagnostics_status = QLabel("", self)
+        layout.addWidget(self.diagnostics_status)
+        self.diagnostics_table = QTableWidget()
+        self.diagnostics_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.diagnostics_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.diagnostics_table)
+
+        layout.refresh_btn.clicked.connect(self.load_diagnostics)
+        layout.reset_btn.clicked.connect(self.reset_diagnostics)
+        layout.dump_btn.clicked.connect(self.dump_diagnostics)
+
+    def _show_results(self, empty_message, filter_text='', status=None, fetch_page=None):
+        """Load the Search Book list with matching books (or fetch_page(cols, after, limit)), one page at a time."""
+        cols = books.columns()
+        if fetch_page is None:
+            self.result_model.load(cols, lambda after, limit: books.page(cols, filter_text, after, limit, status=status, match_year=True))
+        else:
+            self.result_model.load(cols, lambda after, limit: fetch_page(cols, after, limit))
+        self.tab.widget(0).layout().result_label.setText("" if self.result_model.rowCount() else empty_message)
 
     def show_lost_books(self):
-        local_cur = connection.cursor()
-        try :
-            local_cur.execute("SELECT * FROM book WHERE status = 'lost'")
-            data = local_cur.fetchall()
-        finally:
-            local_cur.close()
-        if not data:
-            self.tab.widget(0).layout().result_label.setText("No lost books found.")
-            return
-        out = []
-        for r in data:
-            # sqlite3.Row will raise if a column name doesn't exist; handle older DBs gracefully
-            keys = list(r.keys())
-            r_id = r['id'] if 'id' in keys else ''
-            title = r['title'] if 'title' in keys else ''
-            author = r['author'] if 'author' in keys else ''
-            status = r['status'] if 'status' in keys else ''
-            rcr = r['rack_column_row'] if 'rack_column_row' in keys else ''
-            year_val = r['year'] if 'year' in keys else ''
-            isbn = r['isbn'] if 'isbn' in keys else ''
-            out.append(f"{r_id or isbn}: {title}\n  Author: {author} | Status: {status} | Rack: {rcr} | Year: {year_val} | ISBN: {isbn}")
-        self.tab.widget(0).layout().result_label.setText("\n\n".join(out))
+        self._show_results("No lost books found.", status='lost')
+
     def show_issued_books(self):
-        local_cur = connection.cursor()
-        try :
-            local_cur.execute("SELECT * FROM book WHERE status = 'checked out'")
-            data = local_cur.fetchall()
-        finally:
-            local_cur.close()
-        if not data:
-            self.tab.widget(0).layout().result_label.setText("No checked out books found.")
-            return
-        out = []
-        for r in data:
-            # sqlite3.Row will raise if a column name doesn't exist; handle older DBs gracefully
-            keys = list(r.keys())
-            r_id = r['id'] if 'id' in keys else ''
-            title = r['title'] if 'title' in keys else ''
-            author = r['author'] if 'author' in keys else ''
-            status = r['status'] if 'status' in keys else ''
-            rcr = r['rack_column_row'] if 'rack_column_row' in keys else ''
-            year_val = r['year'] if 'year' in keys else ''
-            isbn = r['isbn'] if 'isbn' in keys else ''
-            out.append(f"{r_id or isbn}: {title}\n  Author: {author} | Status: {status} | Rack: {rcr} | Year: {year_val} | ISBN: {isbn}")
-        self.tab.widget(0).layout().result_label.setText("\n\n".join(out))
-
-    # ...existing code...
+        self._show_results("No checked out books found.", status='checked out')
+
     def show_available_books(self):
-        local_cur = connection.cursor()
-        try:
-            local_cur.execute("SELECT * FROM book WHERE status = 'available'")
-            data = local_cur.fetchall()
-        finally:
-            local_cur.close()
-        if not data:
-            self.tab.widget(0).layout().result_label.setText("No available books found.")
-            return
-        out = []
-        for r in data:
-            keys = list(r.keys())
-            r_id = r['id'] if 'id' in keys else ''
-            title = r['title'] if 'title' in keys else ''
-            author = r['author'] if 'author' in keys else ''
-            status = r['status'] if 'status' in keys else ''
-            rcr = r['rack_column_row'] if 'rack_column_row' in keys else ''
-            year_val = r['year'] if 'year' in keys else ''
-            isbn = r['isbn'] if 'isbn' in keys else ''
-            out.append(f"{r_id or isbn}: {title}\n  Author: {author} | Status: {status} | Rack: {rcr} | Year: {year_val} | ISBN: {isbn}")
-        self.tab.widget(0).layout().result_label.setText("\n\n".join(out))
-# ...existing code...
-
-    def _detect_book_columns(self):
-        """Return list of book columns in preferred order depending on DB."""
-        cur = connection.cursor()
-        try:
-            cur.execute("PRAGMA table_info(book)")
-            cols = [row[1] for row in cur.fetchall()]
-        finally:
-            cur.close()
-        preferred = ['id', 'title', 'author', 'status', 'rack_column_row', 'year', 'isbn']
-        # return intersection in preferred order, then any other columns
-        ordered = [c for c in preferred if c in cols]
-        for c in cols:
-            if c not in ordered:
-                ordered.append(c)
-        return ordered
+        self._show_results("No available books found.", status='available')
 
     def show_books(self) :
-        local_cur = connection.cursor()
-        try :
-            local_cur.execute("SELECT * FROM book")
-            data = local_cur.fetchall()
-        finally :
-            local_cur.close()
-
-        if not data:
-            self.tab.widget(0).layout().result_label.setText("No books found.")
-            return
-
-        out = []
-        for r in data:
-            # sqlite3.Row will raise if a column name doesn't exist; handle older DBs gracefully
-            keys = list(r.keys())
-            r_id = r['id'] if 'id' in keys else ''
-            title = r['title'] if 'title' in keys else ''
-            author = r['author'] if 'author' in keys else ''
-            status = r['status'] if 'status' in keys else ''
-            rcr = r['rack_column_row'] if 'rack_column_row' in keys else ''
-            year_val = r['year'] if 'year' in keys else ''
-            isbn = r['isbn'] if 'isbn' in keys else ''
-            out.append(f"{r_id or isbn}: {title}\n  Author: {author} | Status: {status} | Rack: {rcr} | Year: {year_val} | ISBN: {isbn}")
-        self.tab.widget(0).layout().result_label.setText("\n\n".join(out))
-
-
-
-    def load_books(self, filter_text=''):
-        """Populate the book_table with rows matching optional filter_text."""
-        cols = self._book_columns
+        self._show_results("No books found.")
+
+    def load_books(self, filter_text='', debounce=False):
+        """Populate the book_table with rows matching optional filter_text.
+
+        The first page is read on a worker thread. With debounce (typing in the
+        filter box) the query waits for a pause and newer text cancels it.
+        """
+        self._build_tab(1)
+        self._loaded.add(1)
+        # column lists come from the shared schema catalog, so this is cheap
+        cols = self._book_columns = books.columns()
         if not cols:
             return
-        sel_sql = ",".join(cols)
-        sql = f"SELECT {sel_sql} FROM book"
-        params = ()
-        if filter_text:
-            sql += " WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ?"
-            params = (f"%{filter_text}%", f"%{filter_text}%", f"%{filter_text}%")
-
-        cur = connection.cursor()
-        try:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-        finally:
-            cur.close()
 
-        self.book_table.setRowCount(len(rows))
-        for r_i, r in enumerate(rows):
-            for c_i, col in enumerate(cols):
-                val = r[col] if col in r.keys() else ''
-                item = QTableWidgetItem(str(val) if val is not None else '')
-                self.book_table.setItem(r_i, c_i, item)
+        def fetch_page(after, limit):
+            return books.page(cols, filter_text, after, limit)
+
+        def first_page():
+            # a narrower filter is answered from the cached result of a shorter one
+            return result_cache.first_page('book', cols, filter_text, pool.change_epoch(), fetch_page, *books.refine_rules())
+
+        self.book_query.submit(
+            first_page,
+            lambda first_page: self._apply_books(cols, fetch_page, first_page),
+            self._query_failed,
+            DEBOUNCE_MS if debounce else 0,
+        )
 
+    def _apply_books(self, cols, fetch_page, first_page):
+        self.book_model.populate(cols, fetch_page, first_page)
         # disable edit/remove when nothing is selected; UI selection handler toggles these
         self.tab.widget(1).layout().edit_btn.setEnabled(False)
         self.tab.widget(1).layout().remove_btn.setEnabled(False)
 
     def load_issue_summary(self):
-        """Populate the admin issue summary table showing number of outstanding loans per client."""
-        ensure_loans_table()
-        cur = connection.cursor()
-        try:                                                   
-            cur.execute("UPDATE loans SET fine = CASE WHEN due_date IS NOT NULL AND returned_at IS NULL AND due_date < ? THEN CAST((JULIANDAY(?) - JULIANDAY(due_date)) AS INTEGER) * 1 ELSE 0 END", (datetime.now().isoformat(), datetime.now().isoformat()))
-            cur.execute(
-                "SELECT client_id, client_username, COUNT(*) as issued_count, fine FROM loans WHERE returned_at IS NULL GROUP BY client_id, client_username ORDER BY issued_count DESC"
-            )
-            rows = cur.fetchall()
-        finally:
-            cur.close()
-        # also compute overdue counts per client (due_date < now and not returned)
-        now_iso = datetime.now().isoformat()
-        cur = connection.cursor()
-        overdue_map = {}
-        try:
-            cur.execute(
-                "SELECT client_id, client_username, COUNT(*) as overdue_count, fine FROM loans WHERE returned_at IS NULL AND due_date IS NOT NULL AND due_date < ? GROUP BY client_id, client_username",
-                (now_iso,)
-            )
-            overdue_rows = cur.fetchall()
-            for orow in overdue_rows:
-                key = (orow['client_id'], orow['client_username'])
-                overdue_map[key] = orow['overdue_count']
-        finally:
-            cur.close()
+        """Populate the admin issue summary table showing number of outstanding loans per client.
+
+        The summary advances the overdue counters (a write), so it runs on a
+        worker thread like the table loads.
+        """
+        self._build_tab(3)
+        self._loaded.add(3)
+        self.issue_status.setText("Loading...")
+
+        def summary():
+            # outstanding loans per client, with overdue counts and fines accrued so far
+            return loans.issue_summary(datetime.now().isoformat())
+
+        self.summary_query.submit(
+            summary, self._apply_issue_summary, lambda error: self.issue_status.setText(f"Could not load the summary: {error}")
+        )
 
+    def _apply_issue_summary(self, rows):
+        self.issue_status.setText("" if rows else "No books are checked out.")
         cols = ['CLIENT', 'ISSUED_COUNT', 'OVERDUE', 'FINE']
         self.issue_table.setColumnCount(len(cols))
         self.issue_table.setHorizontalHeaderLabels(cols)
@@ -759,14 +606,51 @@ class AdminWindow(QMainWindow):
         for r_i, r in enumerate(rows):
             client = r['client_username'] if 'client_username' in r.keys() and r['client_username'] else (str(r['client_id']) if 'client_id' in r.keys() and r['client_id'] else 'unknown')
             count = r['issued_count'] if 'issued_count' in r.keys() else ''
-            overdue = overdue_map.get((r['client_id'], r['client_username']), 0)
+            overdue = r['overdue_count']
             self.issue_table.setItem(r_i, 0, QTableWidgetItem(str(client)))
             self.issue_table.setItem(r_i, 1, QTableWidgetItem(str(count)))
             self.issue_table.setItem(r_i, 2, QTableWidgetItem(str(overdue)))
-            self.issue_table.setItem(r_i, 3, QTableWidgetItem(str(r['fine']) if 'fine' in r.keys() else '0'))
+            self.issue_table.setItem(r_i, 3, QTableWidgetItem(str(r['fine'] or 0)))
+
+    def load_diagnostics(self):
+        """Fill the Diagnostics table from sql_stats; the numbers are in memory, so no worker is needed."""
+        self._build_tab(4)
+        self._loaded.add(4)
+        rows = sql_stats.snapshot()
+        self.diagnostics_status.setText(
+            f"{sum(r['count'] for r in rows)} statements in {len(rows)} shapes; {sql_stats.slow_count} at or over "
+            f"{sql_stats.slow_ms} ms, logged to {sql_stats.slow_log_path}"
+        )
+        cols = ['COUNT', 'TOTAL MS', 'P95 MS', 'MAX MS', 'ROWS', 'ERRORS', 'STATEMENT']
+        keys = ['count', 'total_ms', 'p95_ms', 'max_ms', 'rows', 'errors', 'statement']
+        self.diagnostics_table.setColumnCount(len(cols))
+        self.diagnostics_table.setHorizontalHeaderLabels(cols)
+        self.diagnostics_table.setRowCount(len(rows))
+        for r_i, r in enumerate(rows):
+            for c_i, key in enumerate(keys):
+                self.diagnostics_table.setItem(r_i, c_i, QTableWidgetItem(str(r[key])))
+
+    def reset_diagnostics(self):
+        sql_stats.reset()
+        self.load_diagnostics()
+
+    def dump_diagnostics(self):
+        default = os.path.join(os.path.dirname(DB_PATH), f"sql-stats-{datetime.now():%Y%m%d-%H%M%S}.json")
+        path, _ = QFileDialog.getSaveFileName(self, "Save SQL statistics", default, "JSON (*.json)")
+        if not path:
+            return
+        try:
+            sql_stats.dump(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Not saved", f"Could not write {path}: {e}")
+            return
+        QMessageBox.information(self, "Saved", f"SQL statistics saved to {path}.")
+
+    def _query_failed(self, error):
+        QMessageBox.warning(self, "Database error", f"Could not load rows: {error}")
 
     def _on_book_selection_changed(self):
-        has = bool(self.book_table.selectedItems())
+        has = bool(selected_rows(self.book_table))
         try:
             layout = self.tab.widget(1).layout()
             layout.edit_btn.setEnabled(has)
@@ -775,45 +659,29 @@ class AdminWindow(QMainWindow):
             pass
 
     # --- Client helpers ---
-    def _detect_client_columns(self):
-        cur = connection.cursor()
-        try:
-            cur.execute("PRAGMA table_info(client)")
-            cols = [row[1] for row in cur.fetchall()]
-        finally:
-            cur.close()
-        preferred = ['client_id', 'username', 'email', 'password']
-        ordered = [c for c in preferred if c in cols]
-        for c in cols:
-            if c not in ordered:
-                ordered.append(c)
-        return ordered
-
-    def load_clients(self, filter_text=''):
-        cols = self._detect_client_columns()
+    def load_clients(self, filter_text='', debounce=False):
+        """Like load_books, for the client_table."""
+        self._build_tab(2)
+        self._loaded.add(2)
+        cols = clients.columns()
         if not cols:
             return
-        sel_sql = ",".join(cols)
-        sql = f"SELECT {sel_sql} FROM client"
-        params = ()
-        if filter_text:
-            sql += " WHERE username LIKE ? OR email LIKE ?"
-            params = (f"%{filter_text}%", f"%{filter_text}%")
-        cur = connection.cursor()
-        try:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-        finally:
-            cur.close()
-
-        self.client_table.setColumnCount(len(cols))
-        self.client_table.setHorizontalHeaderLabels([c.upper() for c in cols])
-        self.client_table.setRowCount(len(rows))
-        for r_i, r in enumerate(rows):
-            for c_i, col in enumerate(cols):
-                val = r[col] if col in r.keys() else ''
-                self.client_table.setItem(r_i, c_i, QTableWidgetItem(str(val) if val is not None else ''))
 
+        def fetch_page(after, limit):
+            return clients.page(cols, filter_text, after, limit)
+
+        def first_page():
+            return result_cache.first_page('client', cols, filter_text, pool.change_epoch(), fetch_page, clients.row_filter)
+
+        self.client_query.submit(
+            first_page,
+            lambda first_page: self._apply_clients(cols, fetch_page, first_page),
+            self._query_failed,
+            DEBOUNCE_MS if debounce else 0,
+        )
+
+    def _apply_clients(self, cols, fetch_page, first_page):
+        self.client_model.populate(cols, fetch_page, first_page)
         # disable edit/remove initially
         try:
             layout = self.tab.widget(2).layout()
@@ -823,7 +691,7 @@ class AdminWindow(QMainWindow):
             pass
 
     def _on_client_selection_changed(self):
-        has = bool(self.client_table.selectedItems())
+        has = bool(selected_rows(self.client_table))
         try:
             layout = self.tab.widget(2).layout()
             layout.edit_btn.setEnabled(has)
@@ -834,82 +702,54 @@ class AdminWindow(QMainWindow):
     def search_book(self):
         text = self.tab.widget(0).layout().search_input.text().strip()
         if not text:
+            self.result_model.clear()
             self.tab.widget(0).layout().result_label.setText("Please enter a search term.")
             return
+        # a source book code (e.g. B042) is one index lookup: show just where that book is
+        if books.locate(['id'], text)[0]:
+            self._show_results("No books found.", fetch_page=lambda cols, after, limit: books.locate(cols, text))
+            return
+        # numeric input is also matched against the year
+        self._show_results("No books found.", filter_text=text)
 
-        local_cur = connection.cursor()
-        # try to interpret as year if it's numeric
-        year = None
-        if text.isdigit():
-            year = int(text)
-
+    def show_shelf(self):
+        layout = self.tab.widget(0).layout()
+        parts = [layout.cabinet_input.text().strip(), layout.rack_input.text().strip(), layout.row_input.text().strip()]
         try:
-            local_cur.execute(
-                "SELECT * FROM book WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ? OR year = ?",
-                (f"%{text}%", f"%{text}%", f"%{text}%", year),
-            )
-            rows = local_cur.fetchall()
-        finally:
-            local_cur.close()
-
-        if not rows:
-            self.tab.widget(0).layout().result_label.setText("No books found.")
+            cabinet, rack, shelf_row = (int(p) if p else None for p in parts)
+        except ValueError:
+            cabinet = None
+        if cabinet is None or (shelf_row is not None and rack is None):
+            self.result_model.clear()
+            layout.result_label.setText("Enter a cabinet number, optionally a rack, and a row within that rack.")
             return
-
-        out = []
-        for r in rows:
-            # sqlite3.Row will raise if a column name doesn't exist; handle older DBs gracefully
-            keys = list(r.keys())
-            r_id = r['id'] if 'id' in keys else ''
-            title = r['title'] if 'title' in keys else ''
-            author = r['author'] if 'author' in keys else ''
-            status = r['status'] if 'status' in keys else ''
-            rcr = r['rack_column_row'] if 'rack_column_row' in keys else ''
-            year_val = r['year'] if 'year' in keys else ''
-            isbn = r['isbn'] if 'isbn' in keys else ''
-            out.append(f"{r_id or isbn}: {title}\n  Author: {author} | Status: {status} | Rack: {rcr} | Year: {year_val} | ISBN: {isbn}")
-        self.tab.widget(0).layout().result_label.setText("\n\n".join(out))
+        self._show_results(
+            "Nothing on that shelf.",
+            fetch_page=lambda cols, after, limit: books.shelf(cols, cabinet, rack, shelf_row, after, limit),
+        )
 
     def add_book_dialog(self):
         dlg = BookEditDialog(parent=self)
         if dlg.exec() == QDialog.Accepted:
-            title, author, status, rcr, year, isbn = dlg.get_data()
-            local_cur = connection.cursor()
-            try:
-                local_cur.execute(
-                    "INSERT INTO book(title,author,status,rack_column_row,year,isbn) VALUES(?,?,?,?,?,?)",
-                    (title, author, status, rcr, year or None, isbn),
-                )
-                connection.commit()
-            finally:
-                local_cur.close()
+            books.add(*dlg.get_data())
             QMessageBox.information(self, "Added", "Book added successfully.")
             # refresh table
             self.load_books(self.tab.widget(1).layout().book_search.text().strip())
 
     def edit_book_dialog(self):
-        # If a row is selected in the table, edit that; otherwise prompt for pk (id or isbn)
-        pk_col = self._book_columns[0] if self._book_columns else 'isbn'
-        selected = self.book_table.selectedItems()
-        pk_value = None
+        # If a row is selected in the table, edit that; otherwise prompt for its id
+        selected = selected_rows(self.book_table)
+        book_id = None
         if selected:
-            # first column value of the selected row
-            row_idx = selected[0].row()
-            pk_value = self.book_table.item(row_idx, 0).text()
+            book_id = self.book_model.value(selected[0], BOOK_KEY)
         else:
-            prompt = f"Enter book {pk_col} to edit:"
-            id_text, ok = QInputDialog.getText(self, "Edit Book", prompt)
+            id_text, ok = QInputDialog.getText(self, "Edit Book", "Enter book id to edit:")
             if not ok or not id_text.strip():
                 return
-            pk_value = id_text.strip()
+            book_id = book_id_from_text(id_text)
 
-        # fetch the book by pk
-        local_cur = connection.cursor()
-        try:
-            local_cur.execute(f"SELECT * FROM book WHERE {pk_col} = ?", (pk_value,))
-            row = local_cur.fetchone()
-        finally:
-            local_cur.close()
+        # fetch the book by id
+        row = books.get(book_id) if book_id is not None else None
         if not row:
             QMessageBox.warning(self, "Not found", "No book with that identifier")
             return
@@ -925,76 +765,50 @@ class AdminWindow(QMainWindow):
         )
         dlg = BookEditDialog(parent=self, data=data)
         if dlg.exec() == QDialog.Accepted:
-            title, author, status, rcr, year, isbn = dlg.get_data()
-            local_cur = connection.cursor()
-            try:
-                local_cur.execute(
-                    f"UPDATE book SET title=?,author=?,status=?,rack_column_row=?,year=?,isbn=? WHERE {pk_col}=?",
-                    (title, author, status, rcr, year or None, isbn, pk_value),
-                )
-                connection.commit()
-            finally:
-                local_cur.close()
+            books.update(book_id, *dlg.get_data())
             QMessageBox.information(self, "Updated", "Book updated.")
             self.load_books(self.tab.widget(1).layout().book_search.text().strip())
 
     def remove_book(self):
-        # remove selected row if present, else prompt for pk
-        pk_col = self._book_columns[0] if self._book_columns else 'isbn'
-        selected = self.book_table.selectedItems()
+        # remove selected row if present, else prompt for its id
+        selected = selected_rows(self.book_table)
         if selected:
-            row_idx = selected[0].row()
-            pk_value = self.book_table.item(row_idx, 0).text()
+            book_id = self.book_model.value(selected[0], BOOK_KEY)
         else:
-            id_text, ok = QInputDialog.getText(self, "Remove Book", f"Enter book {pk_col} to remove:")
+            id_text, ok = QInputDialog.getText(self, "Remove Book", "Enter book id to remove:")
             if not ok or not id_text.strip():
                 return
-            pk_value = id_text.strip()
+            book_id = book_id_from_text(id_text)
+            if book_id is None:
+                QMessageBox.warning(self, "Not found", "No book with that identifier")
+                return
 
-        if QMessageBox.question(self, "Confirm", f"Delete book {pk_value}?") != QMessageBox.Yes:
+        if QMessageBox.question(self, "Confirm", f"Delete book {book_id}?") != QMessageBox.Yes:
             return
-        local_cur = connection.cursor()
-        try:
-            local_cur.execute(f"DELETE FROM book WHERE {pk_col} = ?", (pk_value,))
-            connection.commit()
-        finally:
-            local_cur.close()
+        books.delete(book_id)
         QMessageBox.information(self, "Removed", "Book removed.")
         self.load_books(self.tab.widget(1).layout().book_search.text().strip())
 
     def add_client_dialog(self) :
         dlg = ClientEditDialog(parent=self)
         if dlg.exec() == QDialog.Accepted:
-            username, password, email = dlg.get_data()
-            cur = connection.cursor()
-            try:
-                cur.execute("INSERT INTO client(username,password,email) VALUES(?,?,?)", (username, password, email))
-                connection.commit()
-            finally:
-                cur.close()
+            clients.add(*dlg.get_data())
             QMessageBox.information(self, "Added", "Client added.")
             self.load_clients(self.tab.widget(2).layout().client_search.text().strip())
 
     def edit_client_dialog(self) :
         # edit selected client or prompt for identifier
-        cols = self._detect_client_columns()
-        pk_col = cols[0] if cols else 'client_id'
-        selected = self.client_table.selectedItems()
+        pk_col = clients.primary_key()
+        selected = selected_rows(self.client_table)
         if selected:
-            row_idx = selected[0].row()
-            pk_value = self.client_table.item(row_idx, 0).text()
+            pk_value = self.client_model.value(selected[0], pk_col)
         else:
             id_text, ok = QInputDialog.getText(self, "Edit Client", f"Enter client {pk_col} to edit:")
             if not ok or not id_text.strip():
                 return
             pk_value = id_text.strip()
 
-        cur = connection.cursor()
-        try:
-            cur.execute(f"SELECT * FROM client WHERE {pk_col} = ?", (pk_value,))
-            row = cur.fetchone()
-        finally:
-            cur.close()
+        row = clients.get(pk_col, pk_value)
         if not row:
             QMessageBox.warning(self, "Not found", "No client with that identifier")
             return
@@ -1005,23 +819,15 @@ class AdminWindow(QMainWindow):
         )
         dlg = ClientEditDialog(parent=self, data=data)
         if dlg.exec() == QDialog.Accepted:
-            username, password, email = dlg.get_data()
-            cur = connection.cursor()
-            try:
-                cur.execute(f"UPDATE client SET username=?,password=?,email=? WHERE {pk_col}=?", (username, password, email, pk_value))
-                connection.commit()
-            finally:
-                cur.close()
+            clients.update(pk_col, pk_value, *dlg.get_data())
             QMessageBox.information(self, "Updated", "Client updated.")
             self.load_clients(self.tab.widget(2).layout().client_search.text().strip())
 
     def remove_client(self) :
-        cols = self._detect_client_columns()
-        pk_col = cols[0] if cols else 'client_id'
-        selected = self.client_table.selectedItems()
+        pk_col = clients.primary_key()
+        selected = selected_rows(self.client_table)
         if selected:
-            row_idx = selected[0].row()
-            pk_value = self.client_table.item(row_idx, 0).text()
+            pk_value = self.client_model.value(selected[0], pk_col)
         else:
             id_text, ok = QInputDialog.getText(self, "Remove Client", f"Enter client {pk_col} to remove:")
             if not ok or not id_text.strip():
@@ -1029,12 +835,7 @@ class AdminWindow(QMainWindow):
             pk_value = id_text.strip()
         if QMessageBox.question(self, "Confirm", f"Delete client {pk_value}?") != QMessageBox.Yes:
             return
-        cur = connection.cursor()
-        try:
-            cur.execute(f"DELETE FROM client WHERE {pk_col} = ?", (pk_value,))
-            connection.commit()
-        finally:
-            cur.close()
+        clients.delete(pk_col, pk_value)
         QMessageBox.information(self, "Removed", "Client removed.")
         self.load_clients(self.tab.widget(2).layout().client_search.text().strip())
 
@@ -1065,16 +866,39 @@ class ClientWindow(QMainWindow):
         tab1_layout.addWidget(tab1_layout.search_button)
         tab1_layout.addWidget(tab1_layout.show_all)
         # search results table for checkout
-        self.search_table = QTableWidget()
-        self.search_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.search_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.search_table = QTableView()
+        self.search_model = PagedTableModel(self)
+        self.search_table.setModel(self.search_model)
+        self.search_table.setSelectionBehavior(QTableView.SelectRows)
+        # ctrl/shift-click picks several books for one checkout
+        self.search_table.setSelectionMode(QTableView.ExtendedSelection)
         self.search_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         tab1_layout.addWidget(self.search_table)
 
-        # checkout button
+        # checkout buttons
+        checkout_row = QHBoxLayout()
         tab1_layout.checkout_btn = QPushButton("Check Out Selected")
         tab1_layout.checkout_btn.setStyleSheet("padding:8px; font-size:14px;")
-        tab1_layout.addWidget(tab1_layout.checkout_btn)
+        tab1_layout.add_to_cart_btn = QPushButton("Add Selected to Cart")
+        tab1_layout.add_to_cart_btn.setStyleSheet("padding:8px; font-size:14px;")
+        checkout_row.addWidget(tab1_layout.checkout_btn)
+        checkout_row.addWidget(tab1_layout.add_to_cart_btn)
+        tab1_layout.addLayout(checkout_row)
+
+        # cart: books gathered across searches, checked out together in one transaction
+        tab1_layout.addWidget(QLabel("Cart"))
+        self.cart = {}
+        self.cart_list = QListWidget()
+        self.cart_list.setSelectionMode(QListWidget.ExtendedSelection)
+        self.cart_list.setMaximumHeight(150)
+        tab1_layout.addWidget(self.cart_list)
+        cart_row = QHBoxLayout()
+        tab1_layout.remove_from_cart_btn = QPushButton("Remove from Cart")
+        tab1_layout.checkout_cart_btn = QPushButton("Check Out Cart")
+        tab1_layout.checkout_cart_btn.setStyleSheet("padding:8px; font-size:14px;")
+        cart_row.addWidget(tab1_layout.remove_from_cart_btn)
+        cart_row.addWidget(tab1_layout.checkout_cart_btn)
+        tab1_layout.addLayout(cart_row)
         self.tab.addTab(tab1_content, "Search Books")
 
         # Create the My Loans tab for this client
@@ -1087,7 +911,7 @@ class ClientWindow(QMainWindow):
 
         self.my_loans_table = QTableWidget()
         self.my_loans_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.my_loans_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.my_loans_table.setSelectionMode(QTableWidget.ExtendedSelection)
         self.my_loans_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         tab2_layout.addWidget(self.my_loans_table)
         # ensure tables show scrollbars when content overflows
@@ -1101,13 +925,7 @@ class ClientWindow(QMainWindow):
         tab3_layout = QVBoxLayout()
         tab3_content.setLayout(tab3_layout)
         tab3_layout.addWidget(QLabel("Profile Information"))
-        local_cur = connection.cursor()
-        try :
-            local_cur.execute("SELECT * FROM client WHERE client_id = ?", (client_id,))
-            connection.commit()
-            row = local_cur.fetchone()
-        finally :
-            local_cur.close()
+        row = clients.get_by_id(client_id)
         tab3_layout.addWidget(QLabel(f"Username: {row['username'] if row and 'username' in row.keys() else ''}"))
         tab3_layout.addWidget(QLabel(f"Email: {row['email'] if row and 'email' in row.keys() else ''}"))
         tab3_layout.change_password_btn = QPushButton("Change Password")
@@ -1120,6 +938,9 @@ class ClientWindow(QMainWindow):
         tab1_layout.search_button.clicked.connect(lambda: self.load_search_results(tab1_layout.search_input.text().strip()))
         tab1_layout.show_all.clicked.connect(lambda: self.load_search_results(''))
         tab1_layout.checkout_btn.clicked.connect(self.checkout_selected)
+        tab1_layout.add_to_cart_btn.clicked.connect(self.add_selected_to_cart)
+        tab1_layout.remove_from_cart_btn.clicked.connect(self.remove_from_cart)
+        tab1_layout.checkout_cart_btn.clicked.connect(self.checkout_cart)
         tab2_layout.refresh_btn.clicked.connect(self.load_my_loans)
         tab2_layout.return_btn.clicked.connect(self.return_selected)
         tab3_layout.change_password_btn.clicked.connect(self.change_password)
@@ -1138,88 +959,85 @@ class ClientWindow(QMainWindow):
             new_password = dlg.get_new_password()
         else:
             return
-        local_cur = connection.cursor()
-        try :
-            local_cur.execute("UPDATE client SET password = ? WHERE client_id = ?",(str(new_password), str(self.client_id)))
-            connection.commit()
-        finally :
-            local_cur.close()
+        clients.set_password(self.client_id, new_password)
         QMessageBox.information(self, "Password Changed", "Your password has been updated successfully.")
 
+    def _selected_books(self):
+        """{book id: title} of the rows selected in search_table, in row order."""
+        return {
+            self.search_model.value(row, BOOK_KEY): self.search_model.value(row, 'title')
+            for row in selected_rows(self.search_table)
+        }
+
     def checkout_selected(self):
-        # ensure loans table
-        ensure_loans_table()
-        # find selected book in search_table
-        selected = self.search_table.selectedItems()
+        selected = self._selected_books()
         if not selected:
             QMessageBox.warning(self, "Select book", "Please select a book to check out.")
             return
-        row_idx = selected[0].row()
-        # assume first column is pk (id or isbn)
-        pk_val = self.search_table.item(row_idx, 0).text()
-        # get title
-        title = self.search_table.item(row_idx, 1).text() if self.search_table.columnCount() > 1 else ''
-        # determine client id/username stored on this window
-        client_id = getattr(self, 'client_id', None)
-        client_username = getattr(self, 'username', '')
+        self._checkout(selected)
 
-        # check book availability
-        cur = connection.cursor()
-        try:
-            cur.execute("SELECT * FROM book WHERE isbn = ? OR id = ?", (pk_val, pk_val))
-            book_row = cur.fetchone()
-        finally:
-            cur.close()
-        if book_row and 'status' in book_row.keys() and book_row['status'] == 'checked out':
-            QMessageBox.warning(self, "Unavailable", "Book is already checked out.")
+    def add_selected_to_cart(self):
+        selected = self._selected_books()
+        if not selected:
+            QMessageBox.warning(self, "Select book", "Please select books to add to the cart.")
             return
+        self.cart.update(selected)
+        self._show_cart()
 
-        # enforce max loans per client
-        cur = connection.cursor()
-        try:
-            if client_id is not None:
-                cur.execute("SELECT COUNT(*) FROM loans WHERE client_id = ? AND returned_at IS NULL", (client_id,))
-            else:
-                cur.execute("SELECT COUNT(*) FROM loans WHERE client_username = ? AND returned_at IS NULL", (client_username,))
-            out_count = cur.fetchone()[0]
-        finally:
-            cur.close()
+    def remove_from_cart(self):
+        for item in self.cart_list.selectedItems():
+            self.cart.pop(item.data(Qt.UserRole), None)
+        self._show_cart()
 
-        if out_count >= MAX_LOANS:
-            QMessageBox.warning(self, "Limit reached", f"You already have {out_count} outstanding loans (max {MAX_LOANS}). Return some books before checking out more.")
+    def checkout_cart(self):
+        if not self.cart:
+            QMessageBox.warning(self, "Empty cart", "Add books to the cart first.")
             return
+        if self._checkout(self.cart):
+            self.cart.clear()
+            self._show_cart()
+
+    def _show_cart(self):
+        self.cart_list.clear()
+        for book_id, title in self.cart.items():
+            self.cart_list.addItem(f"{title} (id {book_id})")
+            self.cart_list.item(self.cart_list.count() - 1).setData(Qt.UserRole, book_id)
+        self.tab.widget(0).layout().checkout_cart_btn.setText(f"Check Out Cart ({len(self.cart)})" if self.cart else "Check Out Cart")
+
+    def _checkout(self, chosen):
+        """Check out every book in chosen ({book id: title}) in one transaction, then refresh once."""
+        # determine client id/username stored on this window
+        client_id = getattr(self, 'client_id', None)
+        client_username = getattr(self, 'username', '')
 
-        # insert loan with due date and mark book checked out
+        # availability and the loan limit are checked inside the checkout transaction
         issued_at = datetime.now()
         due = (issued_at + timedelta(days=LOAN_DAYS)).isoformat()
-        issued_at_iso = issued_at.isoformat()
-        cur = connection.cursor()
         try:
-            cur.execute(
-                "INSERT INTO loans (client_id, client_username, book_pk, book_title, issued_at, due_date, returned_at) VALUES (?,?,?,?,?,?,NULL)",
-                (client_id, client_username, pk_val, title, issued_at_iso, due),
-            )
-            cur.execute("UPDATE book SET status = 'checked out' WHERE isbn = ? OR id = ?", (pk_val, pk_val))
-            connection.commit()
-        finally:
-            cur.close()
-
-        QMessageBox.information(self, "Checked out", "Book checked out successfully.")
+            loans.checkout_many(client_id, client_username, list(chosen), issued_at.isoformat(), due, MAX_LOANS)
+        except BookUnavailable as e:
+            titles = "\n".join(str(chosen.get(b, b)) for b in e.book_ids)
+            QMessageBox.warning(self, "Unavailable", f"Not available, nothing was checked out:\n{titles}")
+            return False
+        except LoanLimitReached as e:
+            QMessageBox.warning(self, "Limit reached", f"You already have {e.count} outstanding loans; {e.requested} more would exceed the maximum of {MAX_LOANS}. Return some books before checking out more.")
+            return False
+        except sqlite3.OperationalError as e:
+            # rolled back either way; only a lock held past the busy timeout is worth retrying
+            if is_busy(e):
+                QMessageBox.warning(self, "Desk busy", DESK_BUSY_MESSAGE)
+            else:
+                QMessageBox.critical(self, "Database error", f"Could not check out: {e}")
+            return False
+
+        QMessageBox.information(self, "Checked out", f"{len(chosen)} book(s) checked out successfully." if len(chosen) > 1 else "Book checked out successfully.")
         # refresh my loans and search results
         self.load_my_loans()
-        self.load_search_results(self.search_table.item(row_idx, 0).text())
+        self.load_search_results(self.tab.widget(0).layout().search_input.text().strip())
+        return True
 
     def load_my_loans(self):
-        ensure_loans_table()
-        cur = connection.cursor()
-        try:
-            if getattr(self, 'client_id', None) is not None:
-                cur.execute("SELECT loan_id, book_pk, book_title, issued_at, due_date, returned_at FROM loans WHERE client_id = ? ORDER BY issued_at DESC", (self.client_id,))
-            else:
-                cur.execute("SELECT loan_id, book_pk, book_title, issued_at, due_date, returned_at FROM loans WHERE client_username = ? ORDER BY issued_at DESC", (getattr(self, 'username', ''),))
-            rows = cur.fetchall()
-        finally:
-            cur.close()
+        rows = loans.for_client(getattr(self, 'client_id', None), getattr(self, 'username', ''))
 
         cols = ['LOAN_ID', 'BOOK', 'TITLE', 'ISSUED_AT', 'DUE_DATE', 'RETURNED_AT']
         self.my_loans_table.setColumnCount(len(cols))
@@ -1234,65 +1052,38 @@ class ClientWindow(QMainWindow):
             self.my_loans_table.setItem(r_i, 5, QTableWidgetItem(str(r['returned_at'] or '')))
 
     def return_selected(self):
-        selected = self.my_loans_table.selectedItems()
-        if not selected:
+        rows = sorted({item.row() for item in self.my_loans_table.selectedItems()})
+        if not rows:
             QMessageBox.warning(self, "Select loan", "Please select a loan to return.")
             return
-        row_idx = selected[0].row()
-        loan_id = self.my_loans_table.item(row_idx, 0).text()
-        book_pk = self.my_loans_table.item(row_idx, 1).text()
-        now = datetime.now().isoformat()
-        cur = connection.cursor()
+        # loans with a RETURNED_AT are already closed
+        loan_ids = [int(self.my_loans_table.item(r, 0).text()) for r in rows if not self.my_loans_table.item(r, 5).text()]
+        if not loan_ids:
+            QMessageBox.warning(self, "Already returned", "The selected loans have already been returned.")
+            return
         try:
-            cur.execute("UPDATE loans SET returned_at = ? WHERE loan_id = ?", (now, loan_id))
-            cur.execute("UPDATE book SET status = 'available' WHERE isbn = ? OR id = ?", (book_pk, book_pk))
-            connection.commit()
-        finally:
-            cur.close()
-        QMessageBox.information(self, "Returned", "Book marked as returned.")
+            loans.return_many(loan_ids, datetime.now().isoformat())
+        except LoanNotOpen:
+            QMessageBox.warning(self, "Already returned", "Some of those loans have already been returned; nothing was changed.")
+            self.load_my_loans()
+            return
+        except sqlite3.OperationalError as e:
+            if is_busy(e):
+                QMessageBox.warning(self, "Desk busy", DESK_BUSY_MESSAGE)
+            else:
+                QMessageBox.critical(self, "Database error", f"Could not return: {e}")
+            return
+        QMessageBox.information(self, "Returned", f"{len(loan_ids)} books marked as returned." if len(loan_ids) > 1 else "Book marked as returned.")
         self.load_my_loans()
 
         # keep a reference to any opened child window so it doesn't get garbage collected
         self._child_window = None
 
-    def _detect_book_columns_client(self):
-        cur = connection.cursor()
-        try:
-            cur.execute("PRAGMA table_info(book)")
-            cols = [row[1] for row in cur.fetchall()]
-        finally:
-            cur.close()
-        preferred = ['id', 'title', 'author', 'status', 'rack_column_row', 'year', 'isbn']
-        ordered = [c for c in preferred if c in cols]
-        for c in cols:
-            if c not in ordered:
-                ordered.append(c)
-        return ordered
-
     def load_search_results(self, filter_text=''):
-        cols = self._detect_book_columns_client()
+        cols = books.columns()
         if not cols:
             return
-        sel_sql = ",".join(cols)
-        sql = f"SELECT {sel_sql} FROM book"
-        params = ()
-        if filter_text:
-            sql += " WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ?"
-            params = (f"%{filter_text}%", f"%{filter_text}%", f"%{filter_text}%")
-        cur = connection.cursor()
-        try:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-        finally:
-            cur.close()
-
-        self.search_table.setColumnCount(len(cols))
-        self.search_table.setHorizontalHeaderLabels([c.upper() for c in cols])
-        self.search_table.setRowCount(len(rows))
-        for r_i, r in enumerate(rows):
-            for c_i, col in enumerate(cols):
-                val = r[col] if col in r.keys() else ''
-                self.search_table.setItem(r_i, c_i, QTableWidgetItem(str(val) if val is not None else ''))
+        self.search_model.load(cols, lambda after, limit: books.page(cols, filter_text, after, limit))
 
 class ChangePasswordDialog(QDialog):
     def __init__(self, parent=None):
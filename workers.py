@@ -0,0 +1,119 @@
+"""Background query execution for the Qt windows.
+
+A QueryExecutor runs queries on a small dedicated thread pool; each worker
+thread reads through its own connection from the ConnectionPool. Submissions
+are debounced, and a newer submission interrupts the query still running for
+an older one (sqlite3 Connection.interrupt), so typing a filter only ever
+applies the result for the latest text.
+"""
+import sqlite3
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+# typing pause before a filter query is started
+DEBOUNCE_MS = 250
+QUERY_THREADS = 2
+
+_threads = None
+
+
+def query_threads():
+    """The shared worker pool. Threads never expire, so their DB connections stay valid."""
+    global _threads
+    if _threads is None:
+        _threads = QThreadPool()
+        _threads.setMaxThreadCount(QUERY_THREADS)
+        _threads.setExpiryTimeout(-1)
+    return _threads
+
+
+class _QueryTask(QRunnable):
+    def __init__(self, executor, generation, fn):
+        super().__init__()
+        self.executor = executor
+        self.generation = generation
+        self.fn = fn
+
+    def run(self):
+        ex = self.executor
+        conn = ex.db_pool.connection()
+        with ex._lock:
+            if self.generation != ex._generation:
+                # superseded while waiting for a thread
+                return
+            ex._running[self.generation] = conn
+        result = error = None
+        try:
+            result = self.fn()
+        except Exception as e:
+            error = e
+        finally:
+            with ex._lock:
+                ex._running.pop(self.generation, None)
+        ex._done.emit(self.generation, result, error)
+
+
+class QueryExecutor(QObject):
+    """Runs only the newest of a stream of queries off the GUI thread.
+
+    submit(fn, on_done) calls fn() on a worker thread after `delay_ms` and
+    hands its return value to on_done on the GUI thread. Results of
+    superseded submissions are dropped; their running queries are interrupted.
+    """
+
+    _done = pyqtSignal(int, object, object)
+
+    def __init__(self, db_pool, parent=None):
+        super().__init__(parent)
+        self.db_pool = db_pool
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._running = {}
+        self._pending = None
+        self._callbacks = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._start)
+        self._done.connect(self._deliver)
+
+    def submit(self, fn, on_done, on_error=None, delay_ms=0):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            # stop whatever an older submission is still running
+            for conn in self._running.values():
+                conn.interrupt()
+        self._pending = (generation, fn)
+        self._callbacks = (generation, on_done, on_error)
+        self._timer.start(delay_ms)
+
+    def cancel(self):
+        """Drop the pending submission and interrupt any running one; no callback runs for either."""
+        self._timer.stop()
+        with self._lock:
+            self._generation += 1
+            for conn in self._running.values():
+                conn.interrupt()
+        self._pending = None
+        self._callbacks = None
+
+    def _start(self):
+        if self._pending is None:
+            return
+        generation, fn = self._pending
+        self._pending = None
+        query_threads().start(_QueryTask(self, generation, fn))
+
+    def _deliver(self, generation, result, error):
+        if self._callbacks is None or generation != self._callbacks[0] or generation != self._generation:
+            return
+        _, on_done, on_error = self._callbacks
+        self._callbacks = None
+        if error is None:
+            on_done(result)
+        elif isinstance(error, sqlite3.OperationalError) and 'interrupted' in str(error):
+            # cancelled by a newer submission; its own result will follow
+            return
+        elif on_error is not None:
+            on_error(error)